@@ -3,7 +3,7 @@ from pysat.card import *
 import math, random, time
 from math import ceil, log, sqrt
 import sys, os
-import csv, signal
+import csv, signal, multiprocessing
 from datetime import datetime
 
 VALID = 0
@@ -13,6 +13,7 @@ NOT = -1
 
 PHASE_DELIMITERS = False
 DEBUG_PRINT = True
+PARALLEL_GOOD_VALS = False # Check all good_vals of a mapping at once, one process each
 
 program_start_time = time.time()
 
@@ -306,6 +307,9 @@ class Schedule:
 
         if DEBUG_PRINT:
             print("Mapping 1/2-good for ", good_vals, end = ' ', flush = True)
+
+        if PARALLEL_GOOD_VALS:
+            return self.is_valid_parallel(mapping, good_vals)
         
         # Logarithmically iterate over same mapping checking *reducible* 1/2-goodness
         for good_val in good_vals:                 
@@ -346,6 +350,57 @@ class Schedule:
 
         return True
 
+    # Worker process for is_valid_parallel: puts whether the mapping is
+    # 1/2-good for subset size good_val on the queue (None on solver error)
+    def good_val_worker(self, mapping, good_val, queue):
+        try:
+            model = Cadical(use_timer = True)
+            self.selection_constraints(mapping, model, [])
+            self.card_constraints(mapping, good_val, model, [])
+            queue.put(not model.solve())
+            model.delete()
+        except Exception as err:
+            queue.put(None)
+
+    # Same check as is_valid, but every good_val is solved in its own process.
+    # Returns False as soon as any of them is not 1/2-good and kills the rest.
+    def is_valid_parallel(self, mapping, good_vals):
+        # Forked so the workers don't re-run this script's driver code
+        ctx = multiprocessing.get_context("fork")
+        queue = ctx.Queue()
+        procs = []
+        for good_val in good_vals:
+            proc = ctx.Process(target=self.good_val_worker,
+                               args=(mapping, good_val, queue), daemon=True)
+            proc.start()
+            procs.append(proc)
+
+        valid = True
+        for i in range(len(procs)):
+            result = queue.get()
+            if result is None:
+                print("\n\n\nException occurred during the pysat solver's operation")
+                clean_up()
+                sys.exit(0)
+            if not result: # Invalid mapping
+                valid = False
+                break
+
+        for proc in procs:
+            if proc.is_alive():
+                proc.terminate()
+            proc.join()
+
+        if DEBUG_PRINT:
+            if valid:
+                print()
+            else:
+                print('\r', end = '')
+                print(' '*100, end = '')
+                print('\033[F', end = '', flush = True)
+
+        return valid
+
     def print(self):
         for slot in self.schedule:
             print(slot)
@@ -0,0 +1,58 @@
+import json, os, time
+
+CHECKPOINT_DIR = './data/checkpoints'
+CHECKPOINT_PERIOD = 5 # Seconds between periodic checkpoint writes
+
+# Position of a long run (exhaustive search or parameter sweep) saved as a
+# small JSON file so the run can resume after an interrupt or crash. Writes go
+# to a temporary file that is renamed over the checkpoint, so a crash mid-write
+# leaves the previous checkpoint intact. There is no fsync, which keeps writes
+# cheap enough to do every few seconds.
+class Checkpoint:
+    active = [] # Checkpoints not yet cleared, saved by save_all on Ctrl+C
+
+    def __init__(self, name, period=CHECKPOINT_PERIOD, directory=CHECKPOINT_DIR):
+        os.makedirs(directory, exist_ok=True)
+        self.path = os.path.join(directory, name + '.json')
+        self.period = period
+        self.last_write = time.time()
+        self.state = None
+        self.pid = os.getpid() # Forked workers inherit this object but must not write it
+        Checkpoint.active.append(self)
+
+    # The saved state, or None if there is nothing to resume
+    def load(self):
+        if not os.path.exists(self.path):
+            return None
+        with open(self.path) as checkpoint_file:
+            return json.load(checkpoint_file)
+
+    # Remember state and write it out if period seconds passed since the last write
+    def update(self, state):
+        self.state = state
+        if time.time() - self.last_write >= self.period:
+            self.save()
+
+    def save(self, state=None):
+        if state is not None:
+            self.state = state
+        if self.state is None or os.getpid() != self.pid:
+            return
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as tmp_file:
+            json.dump(self.state, tmp_file)
+        os.replace(tmp_path, self.path)
+        self.last_write = time.time()
+
+    # The run finished, nothing left to resume
+    def clear(self):
+        self.state = None
+        if os.getpid() == self.pid and os.path.exists(self.path):
+            os.remove(self.path)
+        if self in Checkpoint.active:
+            Checkpoint.active.remove(self)
+
+    @staticmethod
+    def save_all():
+        for checkpoint in Checkpoint.active:
+            checkpoint.save()
@@ -4,11 +4,13 @@ from heapq import *
 from functools import total_ordering
 from itertools import combinations
 from scratch import expected_collisions, expected_distinct_cfs
-#import numpy as np
+import numpy as np
 #from sklearn.neighbors import NearestNeighbors
 
 ERR = -1
 
+POPCOUNT = np.array([bin(byte).count('1') for byte in range(256)], dtype=np.uint8) # Bits set per byte
+
 @total_ordering
 class Wrapper:
     def __init__(self, val):
@@ -39,6 +41,7 @@ class Matrix:
         self.m = -1
         self.num_moves = -1
         self.invalid_rows = None
+        self.data = None # SelectorData the matrix was built from
 
     def sort_rows(self):
         arr = []
@@ -52,7 +55,7 @@ class Matrix:
 
         arr.sort(key=sort_first, reverse=True)
 
-        if invalid_rows != None:
+        if self.invalid_rows != None:
             for i in range(len(self.invalid_rows)): # TODO
                 for j in range(len(arr)):
                     if self.matrix[self.invalid_rows[i]-1] == arr[j][1]:
@@ -76,22 +79,19 @@ class Matrix:
         return num_cfs
 
 
+    # One row per element and one column per set, filled from the selector's
+    # inverted index (sel.data) rather than testing membership in every set
     def to_matrix(self, sel, subset=None):
         if subset != None:
             self.invalid_rows = subset
-        family = sel.family
+        self.data = sel.data
         self.matrix = []
-        for i in range(sel.n):
-            self.matrix.append([])
-
-        for i in range(len(family)):
-            slot = family[i]
-            for j in range(sel.n):
-                if (j+1) in slot:
-                    self.matrix[j].append(1)
-                else:
-                    self.matrix[j].append(0)
-        self.width = len(family)
+        for j in range(sel.n):
+            row = [0] * self.data.num_sets
+            for i in self.data.sets_of(j+1).tolist():
+                row[i] = 1
+            self.matrix.append(row)
+        self.width = self.data.num_sets
         self.height = sel.n
         self.num_moves = 200000
         self.ones_per_row = sel.n*ceil(sel.d*log(sel.n))
@@ -318,3 +318,123 @@ class Matrix:
             family.append(col)
         return family
     """
+
+# Matrix with the rows kept bit-packed in a uint8 array (np.packbits order:
+# column j is bit 7 - j % 8 of byte j // 8, so comparing packed rows byte by
+# byte compares them as binary numbers). Built by a vectorized scatter from
+# the selector's CSR data, with Hamming distances as popcounts over XOR, so
+# the matrix methods stay usable for n in the tens of thousands.
+#
+# Rows and columns are reordered through permutation arrays rather than by
+# moving data: row i of the matrix as seen by the methods is stored at
+# self.matrix[row_perm[i]], and its column j is stored column col_perm[j].
+# Swaps are O(1), sort_rows only permutes row_perm, and the reordered 0/1
+# matrix is only built when it is printed or analyzed.
+class PackedMatrix(Matrix):
+    def to_matrix(self, sel, subset=None):
+        if subset != None:
+            self.invalid_rows = subset
+        self.data = sel.data
+        self.width = self.data.num_sets
+        self.height = sel.n
+        self.row_bytes = (self.width + 7) // 8
+        rows = self.data.indices.astype(np.int64) - 1
+        cols = self.data.entry_sets.astype(np.int64)
+        # Each (row, col) pair is distinct, so summing the bits of a byte ORs them
+        byte_inds = rows * self.row_bytes + (cols >> 3)
+        bits = (0x80 >> (cols & 7)).astype(np.float64)
+        packed = np.bincount(byte_inds, weights=bits, minlength=self.height * self.row_bytes)
+        self.matrix = packed.astype(np.uint8).reshape(self.height, self.row_bytes)
+        self.row_perm = np.arange(self.height)
+        self.col_perm = np.arange(self.width)
+        self.num_moves = 200000
+        self.ones_per_row = sel.n*ceil(sel.d*log(sel.n))
+
+    # Rows in the current order as 0/1 arrays, all of them or only those in row_inds
+    def unpacked(self, row_inds=None):
+        phys_rows = self.row_perm if row_inds is None else self.row_perm[row_inds]
+        bits = np.unpackbits(self.matrix[phys_rows], axis=1, count=self.width)
+        return bits[:, self.col_perm]
+
+    # Rows in the current order, packed with the columns in the current order
+    def packed_rows(self):
+        if np.array_equal(self.col_perm, np.arange(self.width)):
+            return self.matrix[self.row_perm]
+        return np.packbits(self.unpacked(), axis=1)
+
+    # Sort the rows in descending order as binary numbers. Returns the
+    # permutation applied: new row i is the old row order[i].
+    def sort_rows(self):
+        # lexsort is stable and its last key is the primary one
+        order = np.lexsort((255 - self.packed_rows()).T[::-1])
+        if self.invalid_rows != None:
+            new_pos = np.empty(self.height, dtype=np.int64) # Inverse of order
+            new_pos[order] = np.arange(self.height)
+            for i in range(len(self.invalid_rows)):
+                print(f"invalid row {self.invalid_rows[i]} -> {new_pos[self.invalid_rows[i]-1] + 1}")
+                self.invalid_rows[i] = int(new_pos[self.invalid_rows[i]-1]) + 1
+        self.row_perm = self.row_perm[order]
+        return order
+
+    # Column order doesn't matter for counting, so only rows are mapped
+    def num_cfs(self, subset):
+        phys_rows = self.row_perm[[node.vector_index for node in subset]]
+        cfs = np.unpackbits(self.matrix[phys_rows], axis=1, count=self.width).sum(axis=0)
+        return int(np.count_nonzero(cfs == 1))
+
+    def swap_rows(self, inds):
+        ind1 = inds[0]
+        ind2 = inds[1]
+        if ind1 < 0 or ind2 < 0 or ind1 >= self.height or ind2 >= self.height:
+            return ERR
+        if ind1 == ind2:
+            return
+        self.row_perm[ind1], self.row_perm[ind2] = self.row_perm[ind2], self.row_perm[ind1]
+
+    def swap_cols(self, inds):
+        ind1 = inds[0]
+        ind2 = inds[1]
+        if ind1 < 0 or ind2 < 0 or ind1 >= self.width or ind2 >= self.width:
+            return ERR
+        if ind1 == ind2:
+            return
+        self.col_perm[ind1], self.col_perm[ind2] = self.col_perm[ind2], self.col_perm[ind1]
+
+    def print(self):
+        self.print_matrix(self.unpacked().tolist())
+
+    # Hamming distance between two packed rows. Both rows share the column
+    # order, so the stored rows give the same distance.
+    def dist(self, v1, v2):
+        return int(POPCOUNT[np.bitwise_xor(v1, v2)].sum())
+
+    # The k rows closest to query_row, from all distances at once
+    def k_nn_brute_force(self, query_row, k):
+        rows = self.matrix[self.row_perm]
+        dists = POPCOUNT[rows ^ rows[query_row]].sum(axis=1, dtype=np.int64)
+        dists[query_row] = -1 # Sorted first, then dropped
+        order = np.argsort(dists, kind='stable')
+        return order[1:k+1].tolist()
+
+    # Bucket sums per level from np.add.reduceat over the unpacked rows, with
+    # the same buckets as Matrix.subdivide_matrix: a bucket closes at every
+    # multiple of div_len and at the last column, which is left out
+    def subdivide_matrix(self):
+
+        num_matrices = ceil(log(self.width, 2))
+        matrices = []
+        bits = self.unpacked()[:, :self.width - 1]
+
+        for i in range(num_matrices):
+            num_divs = 2**(i+1)
+            div_len = ceil(self.width / num_divs)
+            print(f"i={i}, num_divs = {num_divs}, div_len = {div_len}, length = {self.width}")
+
+            starts = np.arange(0, self.width - 1, div_len)
+            sums = np.add.reduceat(bits, starts, axis=1) if len(starts) > 0 else \
+                   np.zeros((self.height, 1), dtype=np.int64)
+            matrices.append(sums.tolist())
+
+            self.print_matrix(matrices[i])
+
+        return matrices
@@ -1,17 +1,28 @@
-from pysat.solvers import Cadical153
+from pysat.solvers import Cadical153, Glucose4, MapleChrono, Lingeling, Minicard
 from pysat.card import *
-from random import uniform, random
-from math import ceil, floor, sqrt
+from pysat.formula import WCNF
+from pysat.examples.rc2 import RC2
+from random import uniform, random, Random
+from math import ceil, floor, sqrt, comb, exp
 import sys, os, time
 import csv, signal
-import itertools
+import itertools, tracemalloc, multiprocessing, contextlib, io
 from datetime import datetime
+from collections import OrderedDict
+from queue import Empty
+import numpy as np
+from ortools.linear_solver import pywraplp
+from ortools.sat.python import cp_model
 import matrix_code
 from matrix_code import *
 from vp import *
+from verdict_store import *
+from checkpoint import *
+from selector_data import *
 
 VALID   = True
 INVALID = False
+UNKNOWN = None # Solver budget exhausted before a verdict was reached
 
 WEAK_REDUC   = 0
 STRONG_REDUC = 1
@@ -19,11 +30,68 @@ STRONG_REDUC = 1
 SAT_METHOD   = 0
 NAIVE_METHOD = 1
 
+SEL_ENC_DIRECT  = 0 # One clause per (v, S_i), quadratic in set size
+SEL_ENC_COMPACT = 1 # Per-set counter literals, linear in set size
+
 EPS = .001
 
 NOT = -1
 
 DEBUG_INVALID = False
+DEBUG_FORMULA = False # Keep a copy of the CNF clauses for print_clauses
+
+SYMMETRY_BREAKING = True # Lex-leader clauses over interchangeable elements
+
+# Cardinality encodings card_constraints can use. "native" hands the bounds to
+# a solver with native AtMostK constraints (Minicard) instead of encoding them.
+CARD_ENCODINGS = {"seqcounter": EncType.seqcounter, "sortnetwrk": EncType.sortnetwrk,
+                  "cardnetwrk": EncType.cardnetwrk, "totalizer": EncType.totalizer,
+                  "mtotalizer": EncType.mtotalizer, "kmtotalizer": EncType.kmtotalizer,
+                  "native": EncType.native}
+DEFAULT_CARD_ENC = "mtotalizer"
+CARD_CALIBRATION_FILE = './data/card_calibration.csv'
+
+BUDGET_GROWTH = 4 # Factor the budget grows by each time UNKNOWN instances are retried
+MAX_RETRIES   = 3
+CONF_SLICE    = 10000 # Conflicts per solve_limited call under a wall-clock budget
+
+WITNESS_CACHE_SIZE = 64 # Bad k-subsets remembered per (n, k)
+
+FALSIFIER_STEPS    = 10000 # Annealing steps per restart of the local-search falsifier
+FALSIFIER_RESTARTS = 3
+FALSIFIER_TEMP     = 0.5  # Starting temperature, cooled geometrically to FALSIFIER_MIN_TEMP
+FALSIFIER_MIN_TEMP = 0.1
+FALSIFIER_FOCUS    = 0.9  # Share of steps that target a set where a selected member is alone
+FALSIFIER_SAMPLE   = 0.1  # Share of rejected selectors also solved with SAT to time the savings
+FALSIFIER_SHARE    = 0.25 # Search time per selector, as a share of the recent SAT time
+FALSIFIER_POLL     = 64   # Annealing steps between deadline checks
+
+CERT_MAX_N = 4096 # Largest n the co-occurrence certificate builds its dense n x n matrix for
+LP_TOL     = 1e-6 # Slack on the LP bound before rounding it up
+
+CPSAT_WORKERS = os.cpu_count() # Search workers of cpsat_verify
+
+# (backend, seed) pairs raced against each other by portfolio_sat_verify.
+# A seed of None leaves the backend's default configuration.
+PORTFOLIO = [("cadical153", None), ("glucose4", None), ("maplechrono", None),
+             ("lingeling", None), ("cadical153", 1), ("cadical153", 2)]
+
+SOLVERS = {"cadical153": Cadical153, "glucose4": Glucose4,
+           "maplechrono": MapleChrono, "lingeling": Lingeling}
+UNLIMITED_SOLVERS = {"lingeling"} # No conf_budget/solve_limited, bounded only by the race timeout
+
+NUM_SHARDS        = os.cpu_count() # Worker processes for sharded_naive_verify
+PROGRESS_INTERVAL = 2**14 # Subsets a shard checks between progress updates
+REPORT_PERIOD     = 2 # Seconds between subsets/sec reports
+RACE_POLL         = 1 # Seconds between checks for dead workers in race_processes
+
+EXHAUSTIVE_MAX_SUBSETS = 10**7 # Most subsets the sweep checks exhaustively, over all of k_vals
+SWEEP_MARGINS = True # Log min_selected - r of every weak k of each sweep selector
+PARALLEL_GOOD_VALS = False # Driver and sweep check all k at once with parallel_sat_verify
+
+# This file runs its driver code at import time, so worker processes must be
+# forked rather than spawned (which would re-run the whole script)
+mp_context = multiprocessing.get_context("fork")
 
 program_start_time = time.time()
 
@@ -81,10 +149,33 @@ class My_Timer:
         return elapsed
 
 logging_data = False
+benchmarking_encodings = False
+calibrating_card = False
+benchmarking_naive = False
+benchmarking_cpsat = False
+running_portfolio = False
+sweeping = False
+rematerializing = False
 
 if len(sys.argv) > 1:
     if sys.argv[1] == 'log':
         logging_data = True
+    elif sys.argv[1] == 'bench_enc':
+        benchmarking_encodings = True
+    elif sys.argv[1] == 'calibrate_card':
+        calibrating_card = True
+    elif sys.argv[1] == 'bench_naive':
+        benchmarking_naive = True
+    elif sys.argv[1] == 'bench_cpsat':
+        benchmarking_cpsat = True
+    elif sys.argv[1] == 'portfolio':
+        running_portfolio = True
+        logging_data = True
+    elif sys.argv[1] == 'sweep': # sweep [entropy shard_ind num_shards]
+        sweeping = True
+        logging_data = True
+    elif sys.argv[1] == 'remat': # remat log_file row_ind
+        rematerializing = True
 
 now = datetime.now()
 date_time_str = now.strftime("%Y_%m_%d-%H_%M_%S")
@@ -94,12 +185,13 @@ file_obj = None
 if logging_data:
     file_obj = open(filename, 'w')
     writer = csv.writer(file_obj)
-    header = ['c', 'd', 'n', 'k', 'r', 'gen_time', 'solve_time', 'valid', 'sel_len']
+    header = ['c', 'd', 'n', 'solve_time', 'valid', 'method', 'reduc', 'sel_len', 'k', 'seed',
+              'backend']
     writer.writerow(header)
 
 def clean_up():
     if logging_data:
-        f.close()
+        file_obj.close()
         print('closed file')
     else:
         print('not logging data, no file to close')
@@ -107,6 +199,7 @@ def clean_up():
 
 def signal_handler(sig, frame):
     print('\n\n\nYou pressed Ctrl+C')
+    Checkpoint.save_all()
     clean_up()
     sys.exit(0)
 signal.signal(signal.SIGINT, signal_handler)
@@ -138,9 +231,30 @@ def generate_primes(lower, num_primes):
 class InputError(Exception):
     pass
 
+# Limits on a single SAT call, None leaving that resource unlimited
+class Budget:
+    def __init__(self, conflicts=None, propagations=None, seconds=None):
+        self.conflicts = conflicts
+        self.propagations = propagations
+        self.seconds = seconds
+
+    # The same budget scaled up by factor, for retrying UNKNOWN instances
+    def grown(self, factor):
+        scale = lambda limit: None if limit is None else limit * factor
+        return Budget(scale(self.conflicts), scale(self.propagations), scale(self.seconds))
+
+    def __str__(self):
+        return f"conflicts={self.conflicts} propagations={self.propagations} seconds={self.seconds}"
+
+SOLVE_BUDGET = Budget(conflicts=10**7, seconds=300)
+
+# Instances that exhausted their budget, as [sel, k_vals, reduc], to be
+# retried with a bigger budget by retry_unknowns
+unknown_instances = []
+
 
 class Selector:
-    family = []
+    singletons = [] # Elements v with {v} in the family, set by preprocess_sel
 
     def __init__(self, in_n, in_k, in_c, in_d):
         self.n = in_n
@@ -148,24 +262,61 @@ class Selector:
         self.r = ceil(self.k/2)
         self.c = in_c
         self.d = in_d
-
-    # Populates the sets of the selector
-    def populate(self):
-        num_collections = ceil(self.d * math.log(self.n))
-        collection_size = ceil(self.c * self.k)
-        sel_family_size = num_collections * collection_size
-
-        self.family = []
-        for i in range(num_collections):
-            collection = [] # List of lists, each of which is a selector set
-            for j in range(collection_size):
-                collection.append([])
-            for element in range(self.n):
-                index = floor(uniform(0, collection_size))
-                collection[index].append(element+1)
-            for sel_set in collection:
-                if len(sel_set) > 0: 
-                    self.family.append(sel_set)
+        self.seed = None
+        self.indptr = None # CSR storage of the family: set i is
+        self.indices = None # indices[indptr[i]:indptr[i+1]]
+        self._family = []
+        self._data = None
+
+    # The family as a list of lists, built from the CSR arrays on first use
+    @property
+    def family(self):
+        if self._family is None:
+            indices = self.indices.tolist()
+            self._family = [indices[self.indptr[i]:self.indptr[i+1]]
+                            for i in range(len(self.indptr) - 1)]
+        return self._family
+
+    @family.setter
+    def family(self, family):
+        self._family = family
+        self.indptr = None
+        self.indices = None
+        self._data = None
+
+    def set_csr(self, indptr, indices):
+        self.indptr = indptr
+        self.indices = indices
+        self._family = None
+        self._data = None
+
+    # The SelectorData every engine works from, sharing the CSR arrays when
+    # the selector has them. Assign family or call set_csr to replace it.
+    @property
+    def data(self):
+        if self._data is None:
+            if self.indptr is not None:
+                self._data = SelectorData(self.n, self.indptr, self.indices)
+            else:
+                self._data = SelectorData.from_family(self.n, self._family)
+        return self._data
+
+    # Populates the sets of the selector, drawing the buckets of all elements
+    # in all collections at once from the stream of seed (a SeedSequence, see
+    # selector_seed). Without a seed a fresh one is drawn, and either way it
+    # is kept in self.seed, so the family can always be regenerated.
+    def populate(self, seed=None):
+        if seed is None:
+            seed = np.random.SeedSequence()
+        self.seed = seed
+        collection_size = collection_shape(self.n, self.k, self.c, self.d)[1]
+        self.set_csr(*buckets_to_csr(self.draw_buckets(seed), collection_size)[0])
+
+    # The bucket of every element in every collection, shape (1, num_collections, n)
+    def draw_buckets(self, seed):
+        num_collections, collection_size = collection_shape(self.n, self.k, self.c, self.d)
+        rng = np.random.default_rng(seed)
+        return rng.integers(0, collection_size, size=(1, num_collections, self.n))
 
     # Generates an invalid selector for testing purposes
     def bad_populate(self):
@@ -188,6 +339,10 @@ class Selector:
         if (self.n <= 0 or self.k <= 0 or self.r <= 0 or self.k > self.n
                 or self.r > self.k or self.c <= 0 or self.d <= 0):
             return INVALID
+        if self._family is None: # Only CSR storage so far
+            if len(self.indices) > 0 and (self.indices.min() < 1 or self.indices.max() > self.n):
+                return INVALID
+            return VALID
         for sel_set in self.family:
             if type(sel_set) is not list:
                 return INVALID
@@ -264,52 +419,303 @@ def print_clauses(formula):
             print(f"{num_str}   ",end='')
         print()
 
-def prep_sel(n, k, c, d):
+def prep_sel(n, k, c, d, seed=None):
     sel = Selector(n, k, c, d)
-    sel.populate()
+    sel.populate(seed)
     if sel.validate() != VALID:
         print("====================== Invalid selector ======================")
         raise InputError("Invalid selector")
     return sel
 
-def selection_constraints(sel_in, k, r, solver, formula):
-    num_sel_consts = 0
-    # Had to do a little distributing to get this into CNF
+# Generate one selector per seed, all with the same parameters. Each
+# selector's buckets come from its own seed's stream, exactly as prep_sel
+# would draw them, and the CSR arrays of the whole batch are built at once.
+def prep_sel_batch(n, k, c, d, seeds):
+    sels = [Selector(n, k, c, d) for seed in seeds]
+    buckets = np.concatenate([sel.draw_buckets(seed) for sel, seed in zip(sels, seeds)])
+    csrs = buckets_to_csr(buckets, collection_shape(n, k, c, d)[1])
+    for sel, seed, csr in zip(sels, seeds, csrs):
+        sel.set_csr(*csr)
+        sel.seed = seed
+        if sel.validate() != VALID:
+            print("====================== Invalid selector ======================")
+            raise InputError("Invalid selector")
+    return sels
+
+# The seed of a selector: the root entropy of a run plus a spawn key naming
+# the selector within it, e.g. its sweep position and iteration. Any process
+# or machine given the same entropy derives the same, independent streams.
+def selector_seed(entropy, *spawn_key):
+    return np.random.SeedSequence(entropy, spawn_key=spawn_key)
+
+# Seeds are logged as "entropy/key.key..."
+def seed_str(seed):
+    return f"{seed.entropy}/" + ".".join(str(key) for key in seed.spawn_key)
+
+def parse_seed(seed_string):
+    entropy, spawn_key = seed_string.split("/")
+    return selector_seed(int(entropy), *[int(key) for key in spawn_key.split(".") if key])
+
+# Regenerate the selector of a data/ log row (counted from 0 after the header)
+def sel_from_log(path, row_ind):
+    with open(path) as log_file:
+        reader = csv.DictReader(log_file)
+        for i, row in enumerate(reader):
+            if i == row_ind:
+                c, d = [float(row[param]) for param in ['c', 'd']]
+                c, d = [int(param) if param.is_integer() else param for param in [c, d]]
+                return prep_sel(int(row['n']), int(row['k']), c, d, parse_seed(row['seed']))
+    raise InputError(f"{path} has no row {row_ind}")
+
+# Number of collections and buckets per collection of a random selector
+def collection_shape(n, k, c, d):
+    return ceil(d * math.log(n)), ceil(c * k)
+
+# CSR arrays (indptr, indices) of the families given by bucket assignments of
+# shape (num_sels, num_collections, n): bucket j of collection i is a set of
+# the elements assigned j in row i. Empty buckets are dropped and every set
+# lists its elements in increasing order. Returns one (indptr, indices) per
+# selector, sets in the same order as the collections and buckets.
+def buckets_to_csr(buckets, collection_size):
+    num_sels, num_collections, n = buckets.shape
+    sets_per_sel = num_collections * collection_size
+    # Sorting each collection's row by bucket lists the sets one after another.
+    # A stable sort keeps elements increasing, and is a radix sort on int16.
+    if collection_size <= np.iinfo(np.int16).max:
+        buckets = buckets.astype(np.int16)
+    order = np.argsort(buckets, axis=-1, kind='stable')
+    indices = (order + 1).astype(np.int32).reshape(num_sels, num_collections * n)
+    set_ids = (buckets + collection_size * np.arange(num_collections)[:, None]
+               + sets_per_sel * np.arange(num_sels)[:, None, None]).ravel()
+    sizes = np.bincount(set_ids, minlength=num_sels * sets_per_sel).reshape(num_sels, sets_per_sel)
+
+    csrs = []
+    for sel_ind in range(num_sels):
+        set_sizes = sizes[sel_ind][sizes[sel_ind] > 0]
+        indptr = np.concatenate(([0], np.cumsum(set_sizes)))
+        csrs.append((indptr, indices[sel_ind]))
+    return csrs
+
+# Canonicalize the family of a selector before verification: sort every set,
+# drop exact duplicate sets, and record the elements of singleton sets. A
+# singleton {v} means x_{v} alone implies z_{v}, which subsumes every other
+# selection clause of v, so the encoders emit just that implication for v.
+# Duplicates select exactly the same elements, so verdicts are unchanged.
+# Returns a new Selector and reports how much smaller the instance got.
+def preprocess_sel(sel):
+    seen = set()
+    family = []
+    for sel_set in set_lists(sel):
+        canon = tuple(sorted(sel_set))
+        if canon not in seen:
+            seen.add(canon)
+            family.append(list(canon))
+
+    pre_sel = Selector(sel.n, sel.k, sel.c, sel.d)
+    pre_sel.seed = sel.seed
+    pre_sel.family = family
+    pre_sel.singletons = sorted(sel_set[0] for sel_set in family if len(sel_set) == 1)
+
+    singletons = set(pre_sel.singletons)
+    old_clauses = len(sel.data.indices)
+    new_clauses = len(singletons) + sum(1 for sel_set in family for v in sel_set
+                                        if v not in singletons)
+    print(f"Preprocessing: {sel.data.num_sets} -> {len(family)} sets, "
+          f"{len(singletons)} singletons, {old_clauses} -> {new_clauses} selection clauses")
+    return pre_sel
+
+# Map each element v in [1,n] to the indices of the sets containing it
+def element_index(sel):
+    sets = sel.data.elem_indices.tolist()
+    bounds = sel.data.elem_indptr.tolist()
+    return [sets[bounds[v]:bounds[v+1]] for v in range(sel.n + 1)]
+
+# The members of every set as lists, from the CSR arrays
+def set_lists(sel):
+    indices = sel.data.indices.tolist()
+    bounds = sel.data.indptr.tolist()
+    return [indices[bounds[i]:bounds[i+1]] for i in range(sel.data.num_sets)]
+
+# Stream the selection clauses z_{v} | !x_{v} | (x_{u} for u in S_i, u != v),
+# one for each set S_i containing v. Only the (v, S_i) pairs in the inverted
+# index are visited, and the x literals of each set are built once. Elements
+# with a singleton set only get the implication x_{v} -> z_{v}.
+def selection_clauses(sel_in, index=None):
+    n = sel_in.n
+    if index is None:
+        index = element_index(sel_in)
+    x_lits = (sel_in.data.indices + n).tolist()
+    bounds = sel_in.data.indptr.tolist()
+    set_x_lits = [x_lits[bounds[i]:bounds[i+1]] for i in range(sel_in.data.num_sets)]
+    singletons = set(sel_in.singletons)
+
     for v in range(1, n+1):
-        zv,xv = get_var_num(["z",v]), get_var_num(["x",v])
-        for i in range(1, len(sel_in.family)+1):
-            v_in_Si = False
-
-            clause_v_i = [zv, NOT * xv] # Left out the NOT * v_in_Si
-            for x_num_raw in sel_in.family[i-1]:
-                if x_num_raw != v:
-                    x_not_v = get_var_num(["x", x_num_raw])
-                    clause_v_i.append(x_not_v)
-                else:
-                    v_in_Si = True
-            if v_in_Si == True: # If v isn't in Si, the clause is trivially true
-                num_sel_consts += 2
-                solver.add_clause(clause_v_i)
-                formula.append(clause_v_i)
+        zv, xv = v, n + v
+        if v in singletons:
+            yield [zv, NOT * xv]
+            continue
+        for i in index[v]:
+            clause_v_i = [zv, NOT * xv]
+            clause_v_i.extend(x for x in set_x_lits[i] if x != xv)
+            yield clause_v_i
+
+# Compact alternative to selection_clauses that is linear in the total set
+# size. Each set S = [m_1, ..., m_s] with s >= 2 gets a sequential counter
+# over its x literals, where a_j means ">= 1 of m_1..m_j chosen" (a_1 is
+# x_{m_1} itself) and b_j means ">= 2 of m_1..m_j chosen". The counter
+# literals are only implied upwards, so b_s can be true only when at least
+# two members are chosen, and every member v shares the clause
+# z_{v} | !x_{v} | b_s. Auxiliary variables are numbered from top_id + 1.
+def compact_selection_clauses(sel_in, top_id):
+    n = sel_in.n
+    singletons = set(sel_in.singletons)
+    for sel_set in set_lists(sel_in):
+        if len(sel_set) == 1: # Chosen alone, always selected
+            v = sel_set[0]
+            yield [v, NOT * (n + v)]
+            continue
 
-def card_constraints(sel_in, k, r, solver, formula):
+        x_lits = [n + u for u in sel_set]
+        prev_a = x_lits[0]
+        prev_b = None
+        for j in range(1, len(x_lits)):
+            xj = x_lits[j]
+            top_id += 1
+            bj = top_id
+            if prev_b is None: # b_2 -> x_{m_1} & x_{m_2}
+                yield [NOT * bj, prev_a]
+                yield [NOT * bj, xj]
+            else: # b_j -> b_{j-1} | (a_{j-1} & x_{m_j})
+                yield [NOT * bj, prev_b, prev_a]
+                yield [NOT * bj, prev_b, xj]
+            prev_b = bj
+            if j < len(x_lits) - 1: # a_j -> a_{j-1} | x_{m_j}
+                top_id += 1
+                yield [NOT * top_id, prev_a, xj]
+                prev_a = top_id
+
+        for v in sel_set:
+            if v not in singletons: # Else implied by the singleton's clause
+                yield [v, NOT * (n + v), prev_b]
+
+# Number of auxiliary variables compact_selection_clauses introduces
+def compact_num_aux(sel_in):
+    sizes = sel_in.data.set_sizes()
+    return int(np.sum(2*sizes[sizes > 1] - 3))
+
+# Group the elements into classes of interchangeable elements, i.e., those
+# with identical membership rows. Only classes of two or more are returned.
+def interchangeable_classes(sel_in, index=None):
+    if index is None:
+        index = element_index(sel_in)
+    classes = {}
+    for v in range(1, sel_in.n+1):
+        classes.setdefault(tuple(index[v]), []).append(v)
+    return [cls for cls in classes.values() if len(cls) > 1]
+
+# Lex-leader symmetry-breaking clauses. Swapping two interchangeable elements
+# (their x and z together) maps solutions to solutions, so we may require the
+# (x_{v}, z_{v}) pairs of each class to be lexicographically non-increasing:
+# x_{u} >= x_{v}, and z_{u} >= z_{v} whenever x_{u} = x_{v}, for consecutive
+# u < v of a class. Every solution has a sorted image, so satisfiability is
+# unchanged while the symmetric k-subsets are pruned.
+def symmetry_clauses(sel_in, index=None):
+    n = sel_in.n
+    for cls in interchangeable_classes(sel_in, index):
+        for i in range(len(cls) - 1):
+            u, v = cls[i], cls[i+1]
+            yield [n + u, NOT * (n + v)]
+            yield [u, NOT * v, n + u]
+            yield [u, NOT * v, NOT * (n + v)]
+
+# Had to do a little distributing to get this into CNF. The clauses are fed
+# to the solver in bulk; pass a formula list to also keep a copy for display.
+# Returns the greatest variable id used so far.
+def selection_constraints(sel_in, k, r, solver, formula=None, encoding=SEL_ENC_DIRECT):
+    top_id = 2 * sel_in.n
+    index = element_index(sel_in)
+    if encoding == SEL_ENC_COMPACT:
+        clauses = compact_selection_clauses(sel_in, top_id)
+        top_id += compact_num_aux(sel_in)
+    else:
+        clauses = selection_clauses(sel_in, index)
+    if SYMMETRY_BREAKING:
+        clauses = itertools.chain(clauses, symmetry_clauses(sel_in, index))
+    if formula is not None:
+        clauses = list(clauses)
+        formula.extend(clauses)
+    solver.append_formula(clauses)
+    return top_id
+
+# The (n, k) band a calibration result applies to: powers of two in each
+def card_band(n, k):
+    return (n.bit_length(), k.bit_length())
+
+# Read the fastest cardinality encoding per (n, k) band recorded by
+# calibrate_card_encodings, if a calibration has been run
+def load_card_calibration(path=CARD_CALIBRATION_FILE):
+    table = {}
+    if not os.path.exists(path):
+        return table
+    with open(path, 'r') as calib_file:
+        reader = csv.reader(calib_file)
+        next(reader) # Header
+        for row in reader:
+            table[(int(row[0]), int(row[1]))] = row[2]
+    return table
+
+card_enc_table = load_card_calibration()
+
+# The cardinality encoding to use for a selector on n elements and subset size k
+def choose_card_encoding(n, k):
+    return card_enc_table.get(card_band(n, k), DEFAULT_CARD_ENC)
+
+# A fresh solver able to take the given cardinality encoding
+def new_solver(card_enc):
+    if card_enc == "native":
+        return Minicard(use_timer = True)
+    return Cadical153(use_timer = True)
+
+# Add one cardinality constraint, either as clauses or as native AtMostK
+# constraints (CNFPlus atmosts), keeping a display copy in formula if given
+def add_card(card, solver, formula):
+    solver.append_formula(card.clauses)
+    for lits, bound in card.atmosts:
+        solver.add_atmost(lits, bound)
+    if formula is not None:
+        formula.extend(card.clauses)
+        formula.extend(f"atmost {bound}" for lits, bound in card.atmosts)
+
+def card_constraints(sel_in, k, r, solver, formula=None, top_id=None, card_enc=None):
+    n = sel_in.n
+    if top_id is None:
+        top_id = 2*n + 1
+    if card_enc is None:
+        card_enc = choose_card_encoding(n, k)
     # \sum x_{v} = k
     xv_k = CardEnc.equals(lits=list(range(n+1, 2*n+1)), 
-              bound=k, top_id = 2*n + 1, encoding=EncType.mtotalizer)
-    greatest_id = -1
-    for clause in xv_k:
-        solver.add_clause(clause)
-        formula.append(clause)
-        for num in clause:
-            if abs(num) > greatest_id:
-                greatest_id = abs(num)
+              bound=k, top_id = top_id, encoding=CARD_ENCODINGS[card_enc])
+    add_card(xv_k, solver, formula)
 
     # \sum z_{v} < r
     zv_r = CardEnc.atmost(lits=list(range(1, n+1)), 
-              bound=r-1, top_id = greatest_id + 1, encoding=EncType.mtotalizer)
-    for clause in zv_r:
-        solver.add_clause(clause)
-        formula.append(clause)
+              bound=r-1, top_id = max(xv_k.nv, top_id) + 1, encoding=CARD_ENCODINGS[card_enc])
+    add_card(zv_r, solver, formula)
+
+# The stored [verdict, witness, solve_time] of the selector for exactly these
+# k_vals and reducibility mode, or None if there is no store or no entry
+def stored_verdict(store, sel, k_vals, reduc):
+    if store is None:
+        return None
+    stored = store.lookup(sel, k_vals, reduc)
+    if stored is not None:
+        print(f"Verdict store hit: {'VALID' if stored[0] == VALID else 'INVALID'}")
+    return stored
+
+# Save a verdict to the store, if any. UNKNOWN verdicts aren't worth keeping.
+def record_verdict(store, sel, k_vals, reduc, verdict, witness, solve_time):
+    if store is not None and verdict != UNKNOWN:
+        store.record(sel, k_vals, reduc, verdict, witness, solve_time)
 
 def findsubsets(n, k):
     s = range(1, n+1, 1)
@@ -324,11 +730,19 @@ def num_selected(sel_arr):
     return num
 
 # Naively check whether the selector is 1/2-good for the subset sizes in k_vals
-def naive_verify(sel, k_vals):
+def naive_verify(sel, k_vals, store=None, reduc=WEAK_REDUC):
     timer = My_Timer()
     timer.start_timer()
     n = sel.n
 
+    stored = stored_verdict(store, sel, k_vals, reduc)
+    if stored is not None:
+        timer.stop_timer()
+        return [stored[0], timer.get_time(), stored[1]]
+
+    num_sets = sel.data.num_sets
+    entries = list(zip(sel.data.entry_sets.tolist(), sel.data.indices.tolist()))
+
     for k in k_vals:
         print(f"next k = {k}")
         r = ceil(k/2)
@@ -336,75 +750,1502 @@ def naive_verify(sel, k_vals):
 
         for subset in subsets:
             selected = [False] * n
+            num_subset_elems = [0] * num_sets
+            subset_elem = [-1] * num_sets
 
-            for slot in sel.family:
-                num_subset_elems = 0
-                selected_elem = -1
-
-                for elem in slot:
-                    if elem in subset:
-                        num_subset_elems += 1
-                        selected_elem = elem
+            for slot, elem in entries:
+                if elem in subset:
+                    num_subset_elems[slot] += 1
+                    subset_elem[slot] = elem
 
-                if num_subset_elems == 1: # If elem is selected in this slot
-                    selected[selected_elem - 1] = True 
+            for slot in range(num_sets):
+                if num_subset_elems[slot] == 1: # If elem is selected in this slot
+                    selected[subset_elem[slot] - 1] = True
 
             if num_selected(selected) < r:
                 print(f"{subset} invalid")
                 timer.stop_timer()
-                return [INVALID, timer.get_time(), list(subset)]
+                elapsed = timer.get_time()
+                record_verdict(store, sel, k_vals, reduc, INVALID, list(subset), elapsed)
+                return [INVALID, elapsed, list(subset)]
+
+    timer.stop_timer()
+    elapsed = timer.get_time()
+    record_verdict(store, sel, k_vals, reduc, VALID, None, elapsed)
+    return [VALID, elapsed, None]
+
+# Bitmask of a set of elements, element v at bit v-1
+def to_mask(elems):
+    mask = 0
+    for v in elems:
+        mask |= 1 << (v - 1)
+    return mask
+
+# Elements of a bitmask, in increasing order
+def mask_elems(mask):
+    elems = []
+    while mask:
+        low = mask & -mask
+        elems.append(low.bit_length())
+        mask ^= low
+    return elems
+
+# Same check as naive_verify, but every set and every candidate k-subset is an
+# integer bitmask: a set selects an element of the subset iff their AND has
+# exactly one bit set, selected elements are collected with OR and counted
+# with popcount. Subsets are generated lazily instead of materialized.
+def bitset_naive_verify(sel, k_vals, store=None, reduc=WEAK_REDUC):
+    timer = My_Timer()
+    timer.start_timer()
+    n = sel.n
+
+    stored = stored_verdict(store, sel, k_vals, reduc)
+    if stored is not None:
+        timer.stop_timer()
+        return [stored[0], timer.get_time(), stored[1]]
+
+    set_masks = sel.data.set_masks
+    elem_bits = [1 << (v - 1) for v in range(1, n+1)]
+
+    for k in k_vals:
+        print(f"next k = {k}")
+        r = ceil(k/2)
+
+        for subset_bits in itertools.combinations(elem_bits, k):
+            subset_mask = sum(subset_bits)
+            selected = 0
+
+            for set_mask in set_masks:
+                hit = set_mask & subset_mask
+                if hit and not hit & (hit - 1): # Exactly one subset element in this set
+                    selected |= hit
+
+            if selected.bit_count() < r:
+                subset = mask_elems(subset_mask)
+                print(f"{tuple(subset)} invalid")
+                timer.stop_timer()
+                elapsed = timer.get_time()
+                record_verdict(store, sel, k_vals, reduc, INVALID, subset, elapsed)
+                return [INVALID, elapsed, subset]
+
+    timer.stop_timer()
+    elapsed = timer.get_time()
+    record_verdict(store, sel, k_vals, reduc, VALID, None, elapsed)
+    return [VALID, elapsed, None]
+
+# Walk the k-subsets of [1,n] in revolving-door order (Knuth, TAOCP 7.2.1.3,
+# Algorithm R), starting from [1,...,k]. Consecutive subsets differ by a
+# single swap, which is yielded as the pair (out_elem, in_elem). Algorithm R
+# keeps all of its state in the current subset, so passing a subset of the
+# walk as start resumes the walk right after it.
+def revolving_door(n, k, start=None):
+    if start is None:
+        start = list(range(1, k+1))
+    if k == 1:
+        for v in range(start[0], n):
+            yield (v, v+1)
+        return
+    if k >= n:
+        return
+
+    # c[1..k] hold the current subset (0-based) in increasing order, c[k+1] = n
+    c = [None] + [v - 1 for v in sorted(start)] + [n]
+    while True:
+        if k % 2 == 1:
+            if c[1] + 1 < c[2]:
+                c[1] += 1
+                yield (c[1], c[1] + 1)
+                continue
+            j = 2
+            increase = False
+        else:
+            if c[1] > 0:
+                c[1] -= 1
+                yield (c[1] + 2, c[1] + 1)
+                continue
+            j = 2
+            increase = True
+
+        while j <= k:
+            if not increase: # Here c[j] = c[j-1] + 1, try to decrease c[j]
+                if c[j] >= j:
+                    out_elem = c[j]
+                    c[j] = c[j-1]
+                    c[j-1] = j - 2
+                    yield (out_elem + 1, j - 1)
+                    break
+                j += 1
+            else: # Here c[j-1] = j - 2, try to increase c[j]
+                if c[j] + 1 < c[j+1]:
+                    c[j-1] = c[j]
+                    c[j] += 1
+                    yield (j - 1, c[j] + 1)
+                    break
+                j += 1
+            increase = not increase
+        else:
+            return
+
+# Counts for one k-subset of a selector, kept up to date under single-element
+# additions and removals in O(deg(v)): the number of subset members in each
+# set, the xor of those members (the lone member, when there is exactly one)
+# and how many sets select each element. Selected elements are the subset
+# elements that are the lone member of at least one set.
+class SubsetState:
+    def __init__(self, sel, index=None):
+        if index is None:
+            index = element_index(sel)
+        self.index = index
+        self.set_counts = [0] * sel.data.num_sets
+        self.set_xors = [0] * sel.data.num_sets
+        self.sel_counts = [0] * (sel.n + 1)
+        self.in_subset = [False] * (sel.n + 1)
+        self.num_selected = 0
+
+    def select(self, v):
+        self.sel_counts[v] += 1
+        if self.sel_counts[v] == 1:
+            self.num_selected += 1
+
+    def unselect(self, v):
+        self.sel_counts[v] -= 1
+        if self.sel_counts[v] == 0:
+            self.num_selected -= 1
+
+    def add(self, v):
+        self.in_subset[v] = True
+        for i in self.index[v]:
+            if self.set_counts[i] == 1:
+                self.unselect(self.set_xors[i])
+            self.set_counts[i] += 1
+            self.set_xors[i] ^= v
+            if self.set_counts[i] == 1:
+                self.select(v)
+
+    def remove(self, v):
+        self.in_subset[v] = False
+        for i in self.index[v]:
+            if self.set_counts[i] == 1:
+                self.unselect(v)
+            self.set_counts[i] -= 1
+            self.set_xors[i] ^= v
+            if self.set_counts[i] == 1:
+                self.select(self.set_xors[i])
+
+    def swap(self, out_elem, in_elem):
+        self.remove(out_elem)
+        self.add(in_elem)
+
+    def subset(self):
+        return [v for v in range(1, len(self.in_subset)) if self.in_subset[v]]
+
+# Exhaustive check like naive_verify, but the k-subsets are visited in
+# revolving-door order and the counts of SubsetState are updated per swap
+# instead of re-evaluating the whole family for every subset. The position
+# reached (k, rank and current subset) is checkpointed, and a rerun on the
+# same selector resumes from it.
+def revolving_naive_verify(sel, k_vals, store=None, reduc=WEAK_REDUC):
+    timer = My_Timer()
+    timer.start_timer()
+    n = sel.n
+
+    stored = stored_verdict(store, sel, k_vals, reduc)
+    if stored is not None:
+        timer.stop_timer()
+        return [stored[0], timer.get_time(), stored[1]]
+
+    checkpoint = Checkpoint(f"revolving_{selector_hash(sel)[:16]}_{reduc}")
+    resume = checkpoint.load()
+    if resume is not None and resume["k_vals"] != list(k_vals):
+        resume = None
+
+    index = element_index(sel)
+    for k in k_vals:
+        if resume is not None and k != resume["k"]: # Finished before the interrupt
+            continue
+        start = list(range(1, k+1))
+        rank = 0 # Subsets of this size checked so far
+        if resume is not None:
+            print(f"Resuming k={k} at rank {resume['rank']}")
+            start = resume["subset"]
+            rank = resume["rank"] - 1 # The checkpointed subset is checked again
+            resume = None
+
+        print(f"next k = {k}")
+        r = ceil(k/2)
+        state = SubsetState(sel, index)
+        for v in start:
+            state.add(v)
+
+        swaps = revolving_door(n, k, start)
+        while True:
+            if state.num_selected < r:
+                subset = state.subset()
+                print(f"{tuple(subset)} invalid")
+                timer.stop_timer()
+                elapsed = timer.get_time()
+                record_verdict(store, sel, k_vals, reduc, INVALID, subset, elapsed)
+                checkpoint.clear()
+                return [INVALID, elapsed, subset]
+
+            rank += 1
+            if rank % PROGRESS_INTERVAL == 0:
+                checkpoint.update({"k_vals": list(k_vals), "k": k, "rank": rank,
+                                   "subset": state.subset()})
+            swap = next(swaps, None)
+            if swap is None:
+                break
+            state.swap(*swap)
 
     timer.stop_timer()
-    return [VALID, timer.get_time(), None]
+    elapsed = timer.get_time()
+    record_verdict(store, sel, k_vals, reduc, VALID, None, elapsed)
+    checkpoint.clear()
+    return [VALID, elapsed, None]
+
+# The k-subset of [1,n] with the given rank in lexicographic order, via the
+# combinatorial number system
+def unrank_combination(n, k, rank):
+    subset = []
+    v = 1
+    for i in range(k):
+        while True:
+            count = comb(n - v, k - i - 1) # Subsets starting with v at position i
+            if rank < count:
+                break
+            rank -= count
+            v += 1
+        subset.append(v)
+        v += 1
+    return subset
+
+# The first position of subset (of [1,n], increasing) that changes in its
+# lexicographic successor, or -1 if subset is the last one
+def combination_pivot(subset, n):
+    k = len(subset)
+    i = k - 1
+    while i >= 0 and subset[i] == n - k + i + 1:
+        i -= 1
+    return i
+
+# Advance subset in place to its lexicographic successor, given its pivot
+def advance_combination(subset, pivot):
+    subset[pivot] += 1
+    for j in range(pivot+1, len(subset)):
+        subset[j] = subset[j-1] + 1
+
+# Shard worker: check the count k-subsets from rank start on, in lexicographic
+# order with the counts of SubsetState updated incrementally. Progress is
+# published to progress[shard_ind] and the stop event polled every
+# PROGRESS_INTERVAL subsets. Reports [shard_ind, bad k-subset or None, checked]
+def shard_worker(sel, k, start, count, shard_ind, stop, progress, queue):
+    try:
+        r = ceil(k/2)
+        state = SubsetState(sel)
+        subset = unrank_combination(sel.n, k, start)
+        for v in subset:
+            state.add(v)
+
+        checked = 0
+        while True:
+            if state.num_selected < r:
+                stop.set()
+                queue.put([shard_ind, subset, checked])
+                return
+            checked += 1
+            if checked == count:
+                break
+            if checked % PROGRESS_INTERVAL == 0:
+                progress[shard_ind] = checked
+                if stop.is_set():
+                    break
+
+            pivot = combination_pivot(subset, sel.n)
+            for v in subset[pivot:]:
+                state.remove(v)
+            advance_combination(subset, pivot)
+            for v in subset[pivot:]:
+                state.add(v)
+        progress[shard_ind] = checked
+        queue.put([shard_ind, None, checked])
+    except Exception as err:
+        print(f"Shard {shard_ind} failed: {err=}")
+        queue.put([shard_ind, None, None])
+
+# Exhaustive check split across num_shards processes. The C(n, k) subsets are
+# cut into contiguous rank ranges, each worker unranks the first subset of its
+# range and walks the rest. All workers stop once one finds a bad subset.
+# Throughput is reported and the unchecked part of every range checkpointed
+# every REPORT_PERIOD seconds; a rerun on the same selector resumes from it.
+# Returns wall clock time.
+def sharded_naive_verify(sel, k_vals, num_shards=NUM_SHARDS, store=None, reduc=WEAK_REDUC):
+    start_time = time.time()
+    n = sel.n
+
+    stored = stored_verdict(store, sel, k_vals, reduc)
+    if stored is not None:
+        return [stored[0], time.time() - start_time, stored[1]]
+
+    checkpoint = Checkpoint(f"sharded_{selector_hash(sel)[:16]}_{reduc}")
+    resume = checkpoint.load()
+    if resume is not None and resume["k_vals"] != list(k_vals):
+        resume = None
+
+    verdict = VALID
+    for k in k_vals:
+        if resume is not None and k != resume["k"]: # Finished before the interrupt
+            continue
+        print(f"next k = {k}")
+        total = comb(n, k)
+        if resume is not None:
+            ranges = [tuple(rng) for rng in resume["ranges"]]
+            print(f"Resuming k={k} with {sum(rng[1] for rng in ranges)} subsets left")
+            resume = None
+        else:
+            shard_size = ceil(total / num_shards)
+            ranges = [(start, min(shard_size, total - start))
+                      for start in range(0, total, shard_size)]
+        already_done = total - sum(rng[1] for rng in ranges)
+
+        queue = mp_context.Queue()
+        stop = mp_context.Event()
+        progress = mp_context.Array('q', len(ranges), lock=False)
+        procs = []
+        for shard_ind, (start, count) in enumerate(ranges):
+            proc = mp_context.Process(target=shard_worker, daemon=True,
+                      args=(sel, k, start, count, shard_ind, stop, progress, queue))
+            proc.start()
+            procs.append(proc)
+
+        k_start = time.time()
+        bad_subset = None
+        num_reported = 0
+        while num_reported < len(procs):
+            try:
+                shard_ind, subset, checked = queue.get(timeout=REPORT_PERIOD)
+            except Empty:
+                elapsed = time.time() - k_start
+                done_subsets = sum(progress)
+                print(f"\tk={k} {already_done + done_subsets}/{total} subsets, "
+                      f"{done_subsets / elapsed:.0f} subsets/sec", flush=True)
+                checkpoint.save({"k_vals": list(k_vals), "k": k,
+                                 "ranges": [[start + progress[i], count - progress[i]]
+                                            for i, (start, count) in enumerate(ranges)
+                                            if progress[i] < count]})
+                continue
+            num_reported += 1
+            if checked is None:
+                verdict = UNKNOWN
+            elif subset is not None:
+                bad_subset = subset
+                break
+
+        stop.set()
+        for proc in procs:
+            proc.join()
+        queue.close()
+
+        if bad_subset is not None:
+            print(f"{tuple(bad_subset)} invalid")
+            elapsed = time.time() - start_time
+            record_verdict(store, sel, k_vals, reduc, INVALID, bad_subset, elapsed)
+            checkpoint.clear()
+            return [INVALID, elapsed, bad_subset]
+        print(f"\tk={k} {total} subsets in {time.time() - k_start:.4f}s")
+
+    elapsed = time.time() - start_time
+    if verdict == VALID:
+        record_verdict(store, sel, k_vals, reduc, VALID, None, elapsed)
+        checkpoint.clear()
+    return [verdict, elapsed, None]
+
+# The checks each engine runs before solving: the verdict store, the witness
+# cache, the certifiers, then the falsifier on the subset sizes left. Returns
+# [[verdict, elapsed], None] when one of them decides the selector (timer
+# stopped, verdict recorded), else [None, the k of k_vals still to solve].
+def pre_checks(sel, k_vals, timer, cache=None, store=None, reduc=WEAK_REDUC, falsifier=None,
+               certifiers=None):
+    stored = stored_verdict(store, sel, k_vals, reduc)
+    if stored is not None:
+        timer.stop_timer()
+        return [[stored[0], timer.get_time()], None]
+
+    if cache is not None:
+        hit = cache.check(sel, k_vals)
+        if hit is not None: # An earlier witness breaks this selector too
+            timer.stop_timer()
+            elapsed = timer.get_time()
+            record_verdict(store, sel, k_vals, reduc, INVALID, hit[1], elapsed)
+            return [[INVALID, elapsed], None]
+
+    pending_k_vals = k_vals # Subset sizes no certificate covers
+    for certifier in certifiers or []:
+        pending_k_vals = certifier.check(sel, pending_k_vals)
+    if len(pending_k_vals) == 0: # Certified valid, no need to solve
+        timer.stop_timer()
+        elapsed = timer.get_time()
+        record_verdict(store, sel, k_vals, reduc, VALID, None, elapsed)
+        return [[VALID, elapsed], None]
+
+    if falsifier is not None:
+        hit = falsifier.check(sel, pending_k_vals)
+        if hit is not None: # Local search broke the selector, no need to solve
+            timer.stop_timer()
+            elapsed = timer.get_time()
+            if cache is not None:
+                cache.add(sel.n, hit[0], hit[1])
+            record_verdict(store, sel, k_vals, reduc, INVALID, hit[1], elapsed)
+            return [[INVALID, elapsed], None]
+    return [None, pending_k_vals]
 
 # Use SAT solver to check whether the selector is 1/2-good for the subset sizes in k_vals
-def sat_verify(sel, k_vals):
+def sat_verify(sel, k_vals, encoding=SEL_ENC_DIRECT, card_enc=None, budget=None, cache=None,
+               store=None, reduc=WEAK_REDUC, falsifier=None, certifiers=None):
     timer = My_Timer()
     timer.start_timer()
+    verdict = VALID
+    n = sel.n
 
-    for k in k_vals:                 
+    early, pending_k_vals = pre_checks(sel, k_vals, timer, cache, store, reduc, falsifier,
+                                       certifiers)
+    if early is not None:
+        return early
+    solve_start = time.process_time()
+
+    for k in pending_k_vals:
 
         r = ceil(k/2 - EPS)
+        k_card_enc = card_enc if card_enc is not None else choose_card_encoding(sel.n, k)
 
         # Initialize model
-        model = Cadical153(use_timer = True)
-        formula = [] # Not integral to calculation, just for display
+        model = new_solver(k_card_enc)
+        formula = [] if DEBUG_FORMULA else None # Just for display
 
         # Add constraints to model
-        selection_constraints(sel, k, r, model, formula)
-        card_constraints(sel, k, r, model, formula)
+        top_id = selection_constraints(sel, k, r, model, formula, encoding)
+        card_constraints(sel, k, r, model, formula, top_id + 1, k_card_enc)
 
         #Solve model using SAT method
-        try:
-            sat = model.solve()
-        except Exception as err:
-            print("\n\n\nException occurred during the pysat solver's operation")
-            print(f"Unexpected {err=}, {type(err)=}")
-            clean_up()
-            sys.exit(0)
+        sat = limited_solve(model, budget)
 
-        if sat: # Only when not 1/2-good for this subset size
+        if sat == UNKNOWN: # Out of budget, a later k may still be invalid
+            print(f"k={k} out of budget ({budget})")
+            verdict = UNKNOWN
+            model.delete()
+        elif sat: # Only when not 1/2-good for this subset size
             timer.stop_timer()
+            model = model.get_model()
+            k_subset = model_subset(model, n)
+            if cache is not None:
+                cache.add(n, k, k_subset)
+                cache.sat_time += time.process_time() - solve_start
+            if falsifier is not None:
+                falsifier.missed(time.process_time() - solve_start)
             if DEBUG_INVALID == True: # Dump details of the invalid selector
-                model = model.get_model()
-                k_subset = []
                 print("Model:")
                 print(model[:2*n])
-                for xv in range(n+1, 2*n+1):
-                    if model[xv - 1] > 0:
-                        k_subset.append(xv - n)
                 print("k_subset: " + str(k_subset))
                 sel.print_sel(k_subset)
                 input()
-            return [INVALID, timer.get_time()]
+            elapsed = timer.get_time()
+            record_verdict(store, sel, k_vals, reduc, INVALID, k_subset, elapsed)
+            return [INVALID, elapsed]
         else: # Valid selector
             model.delete()
 
+    if cache is not None:
+        cache.sat_time += time.process_time() - solve_start
+    if falsifier is not None:
+        falsifier.solved(time.process_time() - solve_start)
+    timer.stop_timer()
+    elapsed = timer.get_time()
+    record_verdict(store, sel, k_vals, reduc, verdict, None, elapsed)
+    return [verdict, elapsed]
+
+# Whether the budget sets any limit at all
+def has_limits(budget):
+    return budget is not None and (budget.conflicts is not None or budget.propagations is not None
+                                   or budget.seconds is not None)
+
+# Solve within the budget (no limits if budget is None). Returns True (SAT),
+# False (UNSAT) or UNKNOWN if the budget ran out or the solver raised, so a
+# single instance can never stall or kill a sweep. pysat's CaDiCaL can't be
+# interrupted, so the wall clock is checked between solve_limited calls of
+# CONF_SLICE conflicts each, which resume where the previous one stopped.
+def limited_solve(model, budget, assumptions=[]):
+    try:
+        if not has_limits(budget):
+            return model.solve(assumptions=assumptions)
+
+        if budget.propagations is not None:
+            try:
+                model.prop_budget(budget.propagations)
+            except NotImplementedError:
+                print(f"{type(model).__name__} has no propagation budget, ignoring it")
+
+        start_time = time.time()
+        conflicts_left = budget.conflicts
+        while True:
+            slice_size = CONF_SLICE if budget.seconds is not None else conflicts_left
+            if conflicts_left is not None:
+                slice_size = min(slice_size, conflicts_left)
+            if slice_size is not None:
+                model.conf_budget(slice_size)
+
+            sat = model.solve_limited(assumptions=assumptions)
+            if sat is not None:
+                return sat
+
+            if conflicts_left is not None:
+                conflicts_left -= slice_size
+                if conflicts_left <= 0:
+                    return UNKNOWN
+            if budget.seconds is None or time.time() - start_time >= budget.seconds:
+                return UNKNOWN
+    except Exception as err:
+        print("\n\n\nException occurred during the pysat solver's operation")
+        print(f"Unexpected {err=}, {type(err)=}")
+        return UNKNOWN
+
+# limited_solve that also returns the solve time, as [sat, solve_time]. Under a
+# wall-clock budget the solve runs in several solve_limited slices and
+# model.time() only covers the last one, so the solver's accumulated time is
+# compared before and after instead.
+def timed_solve(model, budget, assumptions=[]):
+    accum_start = model.time_accum()
+    sat = limited_solve(model, budget, assumptions)
+    return [sat, model.time_accum() - accum_start]
+
+# 0/1 incidence matrix of the selector, one row per set and one column per element
+def incidence_matrix(sel):
+    matrix = np.zeros((sel.data.num_sets, sel.n), dtype=np.int32)
+    matrix[sel.data.entry_sets, sel.data.indices - 1] = 1
+    return matrix
+
+# Bounded cache of k-subsets that broke earlier selectors, kept per (n, k)
+# with least recently used eviction. Witnesses of random selectors with the
+# same parameters often break new ones too, so each selector is checked
+# against the cache before any CNF is built.
+class WitnessCache:
+    def __init__(self, max_per_key=WITNESS_CACHE_SIZE):
+        self.max_per_key = max_per_key
+        self.witnesses = {} # (n, k) -> OrderedDict of subset tuples, oldest first
+        self.hits = 0
+        self.misses = 0
+        self.check_time = 0
+        self.sat_time = 0 # Time spent solving on misses
+
+    def add(self, n, k, subset):
+        entries = self.witnesses.setdefault((n, k), OrderedDict())
+        key = tuple(sorted(subset))
+        entries[key] = None
+        entries.move_to_end(key)
+        if len(entries) > self.max_per_key:
+            entries.popitem(last=False)
+
+    # Returns a cached k-subset with fewer than r selected elements in sel, or
+    # None. All cached subsets are counted at once from the CSR arrays: each
+    # (subset, member, set of the member) entry is keyed by (subset, set), a
+    # key seen once is a set where the member is alone, and members alone in
+    # some set are selected.
+    def find(self, sel, k, r):
+        entries = self.witnesses.get((sel.n, k))
+        if not entries:
+            return None
+        data = sel.data
+        subsets = np.array(list(entries.keys()), dtype=np.int64)
+        members = subsets.ravel()
+        degrees = data.elem_indptr[members + 1] - data.elem_indptr[members]
+        owners = np.repeat(np.arange(len(members)), degrees) # Position in members
+        starts = np.repeat(data.elem_indptr[members] - np.cumsum(degrees) + degrees, degrees)
+        sets = data.elem_indices[starts + np.arange(len(owners))]
+
+        keys = (owners // k) * data.num_sets + sets
+        _, inverse, counts = np.unique(keys, return_inverse=True, return_counts=True)
+        alone = counts[inverse] == 1
+        selected = np.bincount(owners[alone], minlength=len(members)) > 0
+        bad = np.nonzero(selected.reshape(len(subsets), k).sum(axis=1) < r)[0]
+        if len(bad) == 0:
+            return None
+        subset = tuple(int(v) for v in subsets[bad[0]])
+        entries.move_to_end(subset)
+        return list(subset)
+
+    # Check every k of k_vals. Returns [k, subset] for the first hit, else None.
+    def check(self, sel, k_vals):
+        hit = None
+        if any(self.witnesses.get((sel.n, k)) for k in k_vals):
+            start_time = time.process_time()
+            for k in k_vals:
+                subset = self.find(sel, k, ceil(k/2 - EPS))
+                if subset is not None:
+                    hit = [k, subset]
+                    break
+            self.check_time += time.process_time() - start_time
+        if hit is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return hit
+
+    def report(self):
+        lookups = self.hits + self.misses
+        if lookups == 0:
+            return
+        avg_sat_time = self.sat_time / self.misses if self.misses > 0 else 0
+        print(f"Witness cache: {self.hits}/{lookups} hits ({100 * self.hits / lookups:.1f}%), "
+              f"check time {self.check_time:.4f}, est. SAT time saved "
+              f"{self.hits * avg_sat_time - self.check_time:.4f}")
+
+witness_cache = WitnessCache()
+
+# Local search run in front of the SAT solver: most random invalid selectors
+# are broken by simulated annealing over k-subsets minimizing the number of
+# selected elements. Each step swaps one member out and one element in, with
+# the counts of SubsetState updated in O(deg(v)), for at most share of the
+# recent SAT time per selector once there is one. Tracks how many selectors
+# it rejects and estimates the SAT time saved on them from a sample_rate
+# share of them that are also solved with SAT.
+class Falsifier:
+    def __init__(self, steps=FALSIFIER_STEPS, restarts=FALSIFIER_RESTARTS, seed=None,
+                 sample_rate=FALSIFIER_SAMPLE, share=FALSIFIER_SHARE):
+        self.steps = steps
+        self.restarts = restarts
+        self.share = share
+        self.recent_sat_time = None # Moving average of SAT times, see solved
+        self.rng = Random(seed)
+        self.sample_rate = sample_rate
+        self.attempts = 0
+        self.rejections = 0
+        self.search_time = 0
+        self.missed_invalid = 0 # Invalid selectors only SAT could break
+        self.missed_sat_time = 0 # Time SAT spent breaking them
+        self.sampled = 0 # Rejected selectors also solved with SAT
+        self.sampled_sat_time = 0
+        self.samples = [] # Rejected [sel, k_vals] queued for run_samples
+
+    # Returns a k-subset with fewer than r selected elements, or None once
+    # the steps run out or process time passes deadline
+    def search(self, sel, k, r, index, deadline=None):
+        n = sel.n
+        if k >= n:
+            return None
+        rng = self.rng
+        steps = min(self.steps, comb(n, k)) # No point outlasting exhaustive search
+        cooling = (FALSIFIER_MIN_TEMP / FALSIFIER_TEMP) ** (1 / steps)
+        for restart in range(self.restarts):
+            members = rng.sample(range(1, n+1), k)
+            state = SubsetState(sel, index)
+            for v in members:
+                state.add(v)
+            outside = [v for v in range(1, n+1) if not state.in_subset[v]]
+            out_pos = [None] * (n+1) # Position of each outside element in outside
+            for j in range(n - k):
+                out_pos[outside[j]] = j
+            temp = FALSIFIER_TEMP
+
+            for step in range(steps):
+                if state.num_selected < r:
+                    return state.subset()
+                if (deadline is not None and step % FALSIFIER_POLL == 0
+                        and time.process_time() > deadline):
+                    return None
+
+                i = rng.randrange(k)
+                j = rng.randrange(n - k)
+                if rng.random() < FALSIFIER_FOCUS:
+                    # Bring in another element of a set where a selected member
+                    # is alone, which takes that selection away from it
+                    lone = rng.choice([ind for ind in range(k) if state.sel_counts[members[ind]] > 0])
+                    lone_sets = [set_ind for set_ind in index[members[lone]]
+                                 if state.set_counts[set_ind] == 1]
+                    sel_set = sel.data.members(rng.choice(lone_sets)).tolist()
+                    if len(sel_set) > 1:
+                        v_in = rng.choice(sel_set)
+                        while v_in == members[lone]:
+                            v_in = rng.choice(sel_set)
+                        j = out_pos[v_in]
+                        if i == lone:
+                            i = (i + 1) % k
+
+                before = state.num_selected
+                state.swap(members[i], outside[j])
+                delta = state.num_selected - before
+                if delta <= 0 or rng.random() < exp(-delta / temp):
+                    members[i], outside[j] = outside[j], members[i]
+                    out_pos[outside[j]] = j
+                else:
+                    state.swap(outside[j], members[i])
+                temp *= cooling
+
+            if state.num_selected < r:
+                return state.subset()
+        return None
+
+    # Search every k of k_vals. Returns [k, subset] for the first hit, else None.
+    # Once SAT times are known, the whole search gets share of the recent one,
+    # so it never costs much more than just solving a valid selector would.
+    def check(self, sel, k_vals):
+        start_time = time.process_time()
+        deadline = None
+        if self.recent_sat_time is not None:
+            deadline = start_time + self.share * self.recent_sat_time
+        index = element_index(sel)
+        hit = None
+        for k in k_vals:
+            subset = self.search(sel, k, ceil(k/2 - EPS), index, deadline)
+            if subset is not None:
+                hit = [k, subset]
+                break
+        self.search_time += time.process_time() - start_time
+        self.attempts += 1
+        if hit is not None:
+            self.rejections += 1
+            if self.rng.random() < self.sample_rate:
+                self.samples.append([sel, k_vals])
+        return hit
+
+    # Time SAT on the queued rejected selectors, i.e., what the search saved.
+    # Called once the engine that queued them has logged its solve time, so
+    # these solves stay out of it.
+    def run_samples(self):
+        for sel, k_vals in self.samples:
+            data = incremental_sat_verify(sel, k_vals, budget=SOLVE_BUDGET)
+            self.solved(data[1])
+            if data[0] == INVALID:
+                self.sampled += 1
+                self.sampled_sat_time += data[1]
+        self.samples = []
+
+    # Average SAT time on invalid selectors: from the sample of rejected ones,
+    # else from the ones the search missed
+    def avg_sat_time(self):
+        if self.sampled > 0:
+            return self.sampled_sat_time / self.sampled
+        if self.missed_invalid > 0:
+            return self.missed_sat_time / self.missed_invalid
+        return None
+
+    # SAT decided a selector in sat_time. The average halves the weight of
+    # older times at each update, so it follows changes of n and k quickly.
+    def solved(self, sat_time):
+        if self.recent_sat_time is None:
+            self.recent_sat_time = sat_time
+        else:
+            self.recent_sat_time = (self.recent_sat_time + sat_time) / 2
+
+    # SAT broke a selector the search missed, taking sat_time
+    def missed(self, sat_time):
+        self.missed_invalid += 1
+        self.missed_sat_time += sat_time
+        self.solved(sat_time)
+
+    # Print the rejection rate and estimated savings and, given log_path,
+    # write them there as CSV
+    def report(self, log_path=None):
+        if self.attempts == 0:
+            return
+        self.run_samples()
+        avg_sat_time = self.avg_sat_time()
+        saved = self.rejections * avg_sat_time - self.search_time if avg_sat_time is not None else None
+        print(f"Falsifier: rejected {self.rejections}/{self.attempts} selectors "
+              f"({100 * self.rejections / self.attempts:.1f}%), missed {self.missed_invalid} "
+              f"invalid, search time {self.search_time:.4f}, est. SAT time saved "
+              + (f"{saved:.4f} (SAT timed on {self.sampled} rejected)" if saved is not None
+                 else "unknown (no SAT time on invalid selectors)"))
+        if log_path is not None:
+            with open(log_path, 'w') as log_file:
+                log_writer = csv.writer(log_file)
+                log_writer.writerow(['attempts', 'rejections', 'rejection_rate', 'missed_invalid',
+                                     'search_time', 'sampled', 'avg_sat_time', 'est_saved'])
+                log_writer.writerow([self.attempts, self.rejections,
+                                     self.rejections / self.attempts, self.missed_invalid,
+                                     self.search_time, self.sampled,
+                                     '' if avg_sat_time is None else avg_sat_time,
+                                     '' if saved is None else saved])
+
+falsifier = Falsifier()
+
+# Sufficient condition for 1/2-goodness from element degrees and pairwise
+# co-occurrences co(u, v) (the off-diagonal of M^T M over the incidence matrix
+# M). A set containing a member v of a k-subset fails to select v only if it
+# holds another member u, and at most co(v, u) sets hold both, so v is always
+# selected when deg(v) exceeds the sum of its k-1 largest co-occurrences.
+# Every k-subset has at least k - (number of elements failing this) selected
+# members, so k is certified when at most k - r elements fail. The global form
+# D - (k-1)t > 0 (min degree D, max co-occurrence t) is the case where none
+# fail. Certified subset sizes skip the SAT solver entirely.
+class CooccurrenceCertifier:
+    def __init__(self, max_n=CERT_MAX_N):
+        self.max_n = max_n
+        self.attempts = 0
+        self.certified = 0 # Selectors certified for every k
+        self.k_checked = 0
+        self.k_certified = 0
+        self.k_global = 0 # Subset sizes certified by D - (k-1)t > 0 alone
+        self.check_time = 0
+
+    # Degrees, and per element the sums of its 0, 1, ..., max_k-1 largest
+    # co-occurrences (fewer if n is smaller)
+    def top_sums(self, sel, max_k):
+        incidence = incidence_matrix(sel).astype(np.float32) # BLAS matmul, exact below 2^24
+        co = incidence.T @ incidence
+        degrees = np.diagonal(co).astype(np.int64)
+        np.fill_diagonal(co, 0)
+        width = min(max_k - 1, sel.n - 1)
+        sums = np.zeros((sel.n, width + 1), dtype=np.int64)
+        if width > 0:
+            top = -np.partition(-co, width - 1, axis=1)[:, :width]
+            sums[:, 1:] = np.cumsum(-np.sort(-top, axis=1), axis=1)
+        return degrees, sums
+
+    # The k of k_vals the certificate does not cover, which still need checking
+    def check(self, sel, k_vals):
+        if sel.n > self.max_n or len(k_vals) == 0:
+            return k_vals
+        start_time = time.process_time()
+        degrees, sums = self.top_sums(sel, max(k_vals))
+        min_degree = degrees.min()
+        max_co = sums[:, 1].max() if sums.shape[1] > 1 else 0
+
+        pending = []
+        for k in k_vals:
+            r = ceil(k/2 - EPS)
+            if min_degree - (k-1) * max_co > 0:
+                self.k_global += 1
+                continue
+            failing = np.count_nonzero(degrees <= sums[:, min(k-1, sums.shape[1]-1)])
+            if failing > k - r:
+                pending.append(k)
+
+        self.check_time += time.process_time() - start_time
+        self.attempts += 1
+        self.k_checked += len(k_vals)
+        self.k_certified += len(k_vals) - len(pending)
+        if len(pending) == 0:
+            self.certified += 1
+        return pending
+
+    def report(self):
+        if self.attempts == 0:
+            return
+        print(f"Co-occurrence certificate: certified {self.certified}/{self.attempts} selectors "
+              f"({100 * self.certified / self.attempts:.1f}%), {self.k_certified}/{self.k_checked} "
+              f"subset sizes ({self.k_global} by D - (k-1)t > 0), check time {self.check_time:.4f}")
+
+cooccurrence_certifier = CooccurrenceCertifier()
+
+# Lower bound on the number of selected elements from the LP relaxation of
+# "minimize \sum z_{v} over k-subsets", solved with GLOP:
+#   \sum x_{v} = k,  y_{i} = \sum_{u in S_i} x_{u},
+#   z_{v} >= 2 x_{v} - y_{i}  for every set S_i containing v,
+# with x, z in [0, 1]. The last row is x_{v} - \sum_{u in S_i, u != v} x_{u}
+# written with one auxiliary per set, which keeps the LP linear in the size
+# of the family. Every k-subset is a feasible 0/1 point with z its selected
+# elements, so an LP optimum above r - 1 proves k needs no SAT call. The LP
+# is built once per selector and only the bounds of \sum x_{v} change per k.
+# With log_path, each bound is written there with its solve time.
+class LPBoundCertifier:
+    def __init__(self, log_path=None):
+        self.attempts = 0
+        self.certified = 0 # Selectors certified for every k
+        self.k_checked = 0
+        self.k_certified = 0
+        self.solve_time = 0
+        self.log_file = None
+        if log_path is not None:
+            self.log_file = open(log_path, 'w')
+            self.writer = csv.writer(self.log_file)
+            self.writer.writerow(['n', 'k', 'c', 'd', 'seed', 'subset_size', 'r', 'bound',
+                                  'solve_time', 'certified'])
+
+    # The relaxation with \sum x_{v} unbounded, and that cardinality row
+    def build(self, sel):
+        data = sel.data
+        solver = pywraplp.Solver.CreateSolver("GLOP")
+        x_vars = [None] + [solver.NumVar(0, 1, f"x{v}") for v in range(1, sel.n+1)]
+        z_vars = [None] + [solver.NumVar(0, 1, f"z{v}") for v in range(1, sel.n+1)]
+        y_vars = [solver.NumVar(0, solver.infinity(), f"y{i}") for i in range(data.num_sets)]
+
+        card = solver.Constraint(0, sel.n)
+        for v in range(1, sel.n+1):
+            card.SetCoefficient(x_vars[v], 1)
+
+        indices = data.indices.tolist()
+        bounds = data.indptr.tolist()
+        for i in range(data.num_sets):
+            members = indices[bounds[i]:bounds[i+1]]
+            set_sum = solver.Constraint(0, 0) # y_{i} - \sum_{u in S_i} x_{u} = 0
+            set_sum.SetCoefficient(y_vars[i], 1)
+            for v in members:
+                set_sum.SetCoefficient(x_vars[v], -1)
+            for v in members: # z_{v} - 2 x_{v} + y_{i} >= 0
+                lone = solver.Constraint(0, solver.infinity())
+                lone.SetCoefficient(z_vars[v], 1)
+                lone.SetCoefficient(x_vars[v], -2)
+                lone.SetCoefficient(y_vars[i], 1)
+
+        objective = solver.Objective()
+        for v in range(1, sel.n+1):
+            objective.SetCoefficient(z_vars[v], 1)
+        objective.SetMinimization()
+        return solver, card
+
+    # The k of k_vals the bound does not cover, which still need checking
+    def check(self, sel, k_vals):
+        if len(k_vals) == 0:
+            return k_vals
+        start_time = time.process_time()
+        solver, card = self.build(sel)
+        pending = []
+        for k in k_vals:
+            r = ceil(k/2 - EPS)
+            card.SetBounds(k, k)
+            k_start = time.process_time()
+            status = solver.Solve()
+            k_time = time.process_time() - k_start
+            bound = solver.Objective().Value() if status == pywraplp.Solver.OPTIMAL else None
+            certified = bound is not None and ceil(bound - LP_TOL) >= r
+            print(f"\tk={k} LP bound: {bound if bound is None else round(bound, 4)} "
+                  f"(r={r}) solve time: {k_time:.4f}")
+            if not certified:
+                pending.append(k)
+            if self.log_file is not None:
+                self.writer.writerow([sel.n, sel.k, sel.c, sel.d,
+                                      seed_str(sel.seed) if sel.seed is not None else '',
+                                      k, r, bound, k_time, 'Y' if certified else 'N'])
+
+        if self.log_file is not None:
+            self.log_file.flush()
+        self.solve_time += time.process_time() - start_time
+        self.attempts += 1
+        self.k_checked += len(k_vals)
+        self.k_certified += len(k_vals) - len(pending)
+        if len(pending) == 0:
+            self.certified += 1
+        return pending
+
+    def report(self):
+        if self.attempts == 0:
+            return
+        print(f"LP bound: certified {self.certified}/{self.attempts} selectors "
+              f"({100 * self.certified / self.attempts:.1f}%), {self.k_certified}/{self.k_checked} "
+              f"subset sizes, build and solve time {self.solve_time:.4f}")
+
+    def close(self):
+        if self.log_file is not None:
+            self.log_file.close()
+            self.log_file = None
+
+lp_certifier = LPBoundCertifier(filename + '_lp_bounds' if logging_data else None)
+
+# Extract the chosen k-subset (the x_{v} set to true) from a solver model
+def model_subset(model, n):
+    k_subset = []
+    for xv in range(n+1, 2*n+1):
+        if model[xv - 1] > 0:
+            k_subset.append(xv - n)
+    return k_subset
+
+# Totalizer over lits encoding its count in both directions, capped at
+# ubound: rhs[j] is true iff at least j+1 of lits are true (for j < ubound).
+# Each node with children a, b gets a_i & b_j -> r_{i+j} (i+j <= its output
+# size) and the reverse !a_{i+1} & !b_{j+1} -> !r_{i+j+1}. Both bounds are
+# assumptions over one tree, which is O(n * ubound) clauses rather than the
+# totalizer over !x bounded at n - k that \sum x_{v} >= k otherwise needs.
+class BoundedTotalizer:
+    def __init__(self, lits, ubound, top_id):
+        self.ubound = ubound
+        self.top_id = top_id
+        self.clauses = []
+        self.rhs = self.build(lits)
+
+    def build(self, lits):
+        if len(lits) == 1:
+            return [lits[0]]
+        left = self.build(lits[:len(lits)//2])
+        right = self.build(lits[len(lits)//2:])
+        size = min(len(left) + len(right), self.ubound)
+        out = list(range(self.top_id + 1, self.top_id + size + 1))
+        self.top_id += size
+        for i in range(len(left) + 1):
+            for j in range(len(right) + 1):
+                if i + j > 0: # Upward, counts above size saturate at it
+                    clause = [out[min(i+j, size)-1]]
+                    if i > 0:
+                        clause.append(NOT * left[i-1])
+                    if j > 0:
+                        clause.append(NOT * right[j-1])
+                    self.clauses.append(clause)
+                if i + j < size: # Downward
+                    clause = [NOT * out[i+j]]
+                    if i < len(left):
+                        clause.append(left[i])
+                    if j < len(right):
+                        clause.append(right[j])
+                    self.clauses.append(clause)
+        return out
+
+# Reusable totalizers over the x and z variables of a selector. Each k in
+# k_vals is enforced by assumptions over the totalizer outputs instead of
+# re-encoding \sum x_{v} = k and \sum z_{v} < r from scratch. z_ubound is
+# the largest bound \sum z_{v} <= b that can be assumed (r - 1 by default).
+class CardBounds:
+    def __init__(self, n, k_vals, top_id, z_ubound=None):
+        x_lits = list(range(n+1, 2*n+1))
+        z_lits = list(range(1, n+1))
+        if z_ubound is None:
+            z_ubound = max(ceil(k/2 - EPS) for k in k_vals) - 1
+
+        # \sum x_{v} >= k and \sum x_{v} <= k, counted up to max k + 1
+        self.x_count = BoundedTotalizer(x_lits, max(k_vals) + 1, top_id)
+        # \sum z_{v} <= r - 1
+        self.z_upper = ITotalizer(lits=z_lits, ubound=z_ubound,
+                  top_id=self.x_count.top_id)
+        self.n = n
+        self.top_id = self.z_upper.top_id
+
+    def add_to(self, solver, formula=None):
+        for clauses in [self.x_count.clauses, self.z_upper.cnf.clauses]:
+            solver.append_formula(clauses)
+            if formula is not None:
+                formula.extend(clauses)
+
+    # rhs[i] of a totalizer is implied by its sum being > i, so assuming its
+    # negation bounds the sum by i. Bounds of at least the number of inputs
+    # hold trivially and need no assumption.
+    def atmost_lit(self, tot, bound):
+        if bound < len(tot.rhs):
+            return [NOT * tot.rhs[bound]]
+        return []
+
+    # Assumptions enforcing \sum x_{v} = k
+    def x_assumptions(self, k):
+        atleast = [self.x_count.rhs[k-1]] if k > 0 else []
+        return atleast + self.atmost_lit(self.x_count, k)
+
+    # Assumptions enforcing \sum x_{v} = k and \sum z_{v} < r
+    def assumptions(self, k, r):
+        return self.x_assumptions(k) + self.atmost_lit(self.z_upper, r - 1)
+
+    def delete(self):
+        self.z_upper.delete()
+
+# Use a single incremental SAT solver to check whether the selector is
+# 1/2-good for the subset sizes in k_vals. The selection clauses are loaded
+# once, each k only switches assumptions, so learned clauses carry over.
+# Also returns the solve time of each k.
+def incremental_sat_verify(sel, k_vals, encoding=SEL_ENC_DIRECT, budget=None, cache=None,
+                           store=None, reduc=WEAK_REDUC, falsifier=None, certifiers=None):
+    timer = My_Timer()
+    timer.start_timer()
+    n = sel.n
+    k_times = {}
+    verdict = VALID
+
+    early, pending_k_vals = pre_checks(sel, k_vals, timer, cache, store, reduc, falsifier,
+                                       certifiers)
+    if early is not None:
+        return early + [k_times]
+    solve_start = time.process_time()
+
+    model = Cadical153(use_timer = True)
+    formula = [] if DEBUG_FORMULA else None # Just for display
+    top_id = selection_constraints(sel, None, None, model, formula, encoding)
+    bounds = CardBounds(n, pending_k_vals, top_id)
+    bounds.add_to(model, formula)
+
+    for k in pending_k_vals:
+
+        r = ceil(k/2 - EPS)
+
+        sat, k_times[k] = timed_solve(model, budget, bounds.assumptions(k, r))
+        print(f"\tk={k} solve time: {k_times[k]:.4f}")
+
+        if sat == UNKNOWN: # Out of budget, a later k may still be invalid
+            print(f"k={k} out of budget ({budget})")
+            verdict = UNKNOWN
+        elif sat: # Only when not 1/2-good for this subset size
+            timer.stop_timer()
+            k_subset = model_subset(model.get_model(), n)
+            if cache is not None:
+                cache.add(n, k, k_subset)
+                cache.sat_time += time.process_time() - solve_start
+            if falsifier is not None:
+                falsifier.missed(time.process_time() - solve_start)
+            if DEBUG_INVALID == True: # Dump details of the invalid selector
+                print("k_subset: " + str(k_subset))
+                sel.print_sel(k_subset)
+                input()
+            bounds.delete()
+            model.delete()
+            elapsed = timer.get_time()
+            record_verdict(store, sel, k_vals, reduc, INVALID, k_subset, elapsed)
+            return [INVALID, elapsed, k_times]
+
+    bounds.delete()
+    model.delete()
+    if cache is not None:
+        cache.sat_time += time.process_time() - solve_start
+    if falsifier is not None:
+        falsifier.solved(time.process_time() - solve_start)
+    timer.stop_timer()
+    elapsed = timer.get_time()
+    record_verdict(store, sel, k_vals, reduc, verdict, None, elapsed)
+    return [verdict, elapsed, k_times]
+
+# Boolean CP-SAT model of the selector: one Bool per x_{v} and z_{v}, the
+# selection and symmetry clauses streamed from the sparse index as AddBoolOr
+# (AddImplication for the binary ones), and linear sums only for the
+# cardinalities. Each k gets \sum x_{v} = k and \sum z_{v} < r enforced by
+# its own literal, so one model serves every k through assumptions.
+class CpSatModel:
+    def __init__(self, sel, k_vals):
+        n = sel.n
+        self.model = cp_model.CpModel()
+        self.lits = [None] + [self.model.NewBoolVar(f"z{v}") for v in range(1, n+1)] \
+                           + [self.model.NewBoolVar(f"x{v}") for v in range(1, n+1)]
+        index = element_index(sel)
+        clauses = selection_clauses(sel, index)
+        if SYMMETRY_BREAKING:
+            clauses = itertools.chain(clauses, symmetry_clauses(sel, index))
+        for clause in clauses:
+            if len(clause) == 2: # a | b, i.e., !b -> a
+                self.model.AddImplication(self.lit(NOT * clause[1]), self.lit(clause[0]))
+            else:
+                self.model.AddBoolOr([self.lit(lit) for lit in clause])
+
+        x_vars = self.lits[n+1:]
+        z_vars = self.lits[1:n+1]
+        self.k_lits = {}
+        for k in k_vals:
+            r = ceil(k/2 - EPS)
+            k_lit = self.model.NewBoolVar(f"k{k}")
+            self.model.Add(sum(x_vars) == k).OnlyEnforceIf(k_lit)
+            self.model.Add(sum(z_vars) <= r - 1).OnlyEnforceIf(k_lit)
+            self.k_lits[k] = k_lit
+        self.n = n
+
+    # CP-SAT literal of a DIMACS-style literal over z_{v} = v, x_{v} = n + v
+    def lit(self, lit):
+        return self.lits[lit] if lit > 0 else self.lits[-lit].Not()
+
+    # Hint the subset and the elements it selects
+    def hint(self, sel, subset):
+        self.model.ClearHints()
+        chosen = set(subset)
+        selected = set(selected_elements(sel, subset))
+        for v in range(1, self.n+1):
+            self.model.AddHint(self.lits[self.n + v], v in chosen)
+            self.model.AddHint(self.lits[v], v in selected)
+
+    def solve(self, solver, k):
+        self.model.ClearAssumptions()
+        self.model.AddAssumptions([self.k_lits[k]])
+        return solver.Solve(self.model)
+
+    def subset(self, solver):
+        return [v for v in range(1, self.n+1) if solver.Value(self.lits[self.n + v])]
+
+# Subset to hint for k: the newest cached witness for (n, k) if there is one,
+# else the k elements in the fewest sets, which are the likeliest unselected
+def cpsat_hint(sel, k, cache):
+    if cache is not None and len(cache.witnesses.get((sel.n, k), {})) > 0:
+        return list(next(reversed(cache.witnesses[(sel.n, k)])))
+    degrees = np.diff(sel.data.elem_indptr)[1:]
+    return (np.argsort(degrees, kind='stable')[:k] + 1).tolist()
+
+# Check whether the selector is 1/2-good for the subset sizes in k_vals with
+# the Boolean CP-SAT model, on CPSAT_WORKERS search workers. Same interface
+# and verdicts as sat_verify; the budget's conflicts and seconds map onto
+# CP-SAT's limits.
+def cpsat_verify(sel, k_vals, budget=None, cache=None, store=None, reduc=WEAK_REDUC,
+                 falsifier=None, certifiers=None, workers=CPSAT_WORKERS):
+    timer = My_Timer()
+    timer.start_timer()
+    verdict = VALID
+    n = sel.n
+
+    early, pending_k_vals = pre_checks(sel, k_vals, timer, cache, store, reduc, falsifier,
+                                       certifiers)
+    if early is not None:
+        return early
+    solve_start = time.process_time()
+
+    model = CpSatModel(sel, pending_k_vals)
+    solver = cp_model.CpSolver()
+    solver.parameters.num_search_workers = workers
+    if budget is not None and budget.seconds is not None:
+        solver.parameters.max_time_in_seconds = budget.seconds
+    if budget is not None and budget.conflicts is not None:
+        solver.parameters.max_number_of_conflicts = budget.conflicts
+
+    for k in pending_k_vals:
+        model.hint(sel, cpsat_hint(sel, k, cache))
+        status = model.solve(solver, k)
+        print(f"\tk={k} CP-SAT {solver.StatusName(status)} solve time: {solver.WallTime():.4f}")
+
+        if status == cp_model.INFEASIBLE: # 1/2-good for this subset size
+            continue
+        elif status not in (cp_model.OPTIMAL, cp_model.FEASIBLE):
+            # Out of budget (or MODEL_INVALID), a later k may still be invalid
+            print(f"k={k} CP-SAT {solver.StatusName(status)} ({budget})")
+            verdict = UNKNOWN
+        else: # Not 1/2-good for this subset size
+            timer.stop_timer()
+            k_subset = model.subset(solver)
+            if cache is not None:
+                cache.add(n, k, k_subset)
+                cache.sat_time += time.process_time() - solve_start
+            if falsifier is not None:
+                falsifier.missed(time.process_time() - solve_start)
+            elapsed = timer.get_time()
+            record_verdict(store, sel, k_vals, reduc, INVALID, k_subset, elapsed)
+            return [INVALID, elapsed]
+
+    if cache is not None:
+        cache.sat_time += time.process_time() - solve_start
+    if falsifier is not None:
+        falsifier.solved(time.process_time() - solve_start)
     timer.stop_timer()
-    return [VALID, timer.get_time()]
+    elapsed = timer.get_time()
+    record_verdict(store, sel, k_vals, reduc, verdict, None, elapsed)
+    return [verdict, elapsed]
+
+# Stand-in for a solver that just collects the clauses added to it
+class ClauseSink(list):
+    def append_formula(self, clauses):
+        self.extend(clauses)
+
+# The complete CNF checking whether the selector is 1/2-good for subset size k.
+# Native cardinality constraints aren't clauses, so they fall back to the default.
+def instance_clauses(sel, k, r, encoding=SEL_ENC_DIRECT):
+    clauses = ClauseSink()
+    card_enc = choose_card_encoding(sel.n, k)
+    if card_enc == "native":
+        card_enc = DEFAULT_CARD_ENC
+    top_id = selection_constraints(sel, k, r, clauses, None, encoding)
+    card_constraints(sel, k, r, clauses, None, top_id + 1, card_enc)
+    return clauses
+
+# Start one process per (target, args) task, each of which puts exactly one
+# result on the queue passed as its last argument. Results are collected until
+# one satisfies done(result), at which point the remaining workers are killed.
+# A worker that dies without reporting (killed, or crashed outside its own
+# error handling), or is still running after timeout wall clock seconds,
+# counts as an UNKNOWN result [None, UNKNOWN, None, None].
+# Returns the deciding result (None if none decided) and all results received.
+def race_processes(tasks, done, timeout=None):
+    start_time = time.time()
+    queue = mp_context.Queue()
+    procs = []
+    for target, args in tasks:
+        proc = mp_context.Process(target=target, args=args + (queue,), daemon=True)
+        proc.start()
+        procs.append(proc)
+
+    winner = None
+    results = []
+    exited = False
+    while winner is None and len(results) < len(procs):
+        try:
+            result = queue.get(timeout=RACE_POLL)
+        except Empty:
+            # Once every worker has exited, one more poll drains what they put
+            # before exiting, and whatever is still missing was never reported
+            if exited or (timeout is not None and time.time() - start_time > timeout):
+                break
+            exited = not any(proc.is_alive() for proc in procs)
+            continue
+        results.append(result)
+        if done(result):
+            winner = result
+
+    if winner is None:
+        results += [[None, UNKNOWN, None, None] for i in range(len(procs) - len(results))]
+
+    for proc in procs:
+        if proc.is_alive():
+            proc.terminate()
+        proc.join()
+    queue.close()
+    return winner, results
+
+# Portfolio worker: solve the clauses with one backend and report
+# [backend label, sat, k-subset or None, solve time]. Backends in
+# UNLIMITED_SOLVERS solve without the budget and are stopped by the race.
+def portfolio_worker(backend, seed, clauses, n, budget, queue):
+    label = backend if seed is None else f"{backend}-s{seed}"
+    if backend in UNLIMITED_SOLVERS:
+        budget = None
+    try:
+        model = SOLVERS[backend](use_timer = True)
+        if seed is not None:
+            model.configure({"seed": seed})
+        model.append_formula(clauses)
+        sat, solve_time = timed_solve(model, budget)
+        k_subset = model_subset(model.get_model(), n) if sat else None
+        queue.put([label, sat, k_subset, solve_time])
+        model.delete()
+    except Exception as err:
+        print(f"Portfolio backend {label} failed: {err=}")
+        queue.put([label, None, None, None])
+
+# Use a portfolio of SAT backends racing in separate processes to check
+# whether the selector is 1/2-good for the subset sizes in k_vals. The first
+# backend to answer decides each k and the others are killed. A race lasts
+# at most budget.seconds of wall clock. Returns wall clock time and the
+# winning backend of each k.
+def portfolio_sat_verify(sel, k_vals, encoding=SEL_ENC_DIRECT, portfolio=PORTFOLIO, budget=None):
+    start_time = time.time()
+    winners = []
+    verdict = VALID
+    timeout = budget.seconds if budget is not None else None
 
-# Print the results of that iteration and, if logging data, write it to file
-def log_data(sel, data, method, reduc):
+    for k in k_vals:
+
+        r = ceil(k/2 - EPS)
+        clauses = instance_clauses(sel, k, r, encoding)
+        tasks = [(portfolio_worker, (backend, seed, clauses, sel.n, budget))
+                 for backend, seed in portfolio]
+        winner, results = race_processes(tasks, lambda result: result[1] is not None, timeout)
+
+        if winner is None: # Out of budget, a later k may still be invalid
+            print(f"\tk={k} no portfolio backend finished ({budget})")
+            verdict = UNKNOWN
+            winners.append("none")
+            continue
+        label, sat, k_subset, solve_time = winner
+        winners.append(label)
+        print(f"\tk={k} won by {label} in {solve_time:.4f}")
+
+        if sat: # Only when not 1/2-good for this subset size
+            if DEBUG_INVALID == True: # Dump details of the invalid selector
+                print("k_subset: " + str(k_subset))
+                sel.print_sel(k_subset)
+                input()
+            return [INVALID, time.time() - start_time, winners]
+
+    return [verdict, time.time() - start_time, winners]
+
+# Parallel k worker: build and solve the instance for subset size k, report
+# [k, sat, k-subset or None, solve time]
+def k_worker(sel, k, encoding, budget, queue):
+    try:
+        r = ceil(k/2 - EPS)
+        card_enc = choose_card_encoding(sel.n, k)
+        model = new_solver(card_enc)
+        top_id = selection_constraints(sel, k, r, model, None, encoding)
+        card_constraints(sel, k, r, model, None, top_id + 1, card_enc)
+        sat, solve_time = timed_solve(model, budget)
+        k_subset = model_subset(model.get_model(), sel.n) if sat else None
+        queue.put([k, sat, k_subset, solve_time])
+        model.delete()
+    except Exception as err:
+        print(f"k={k} worker failed: {err=}")
+        queue.put([k, None, None, None])
+
+# Check every subset size in k_vals at once, one process per k. The selector
+# is INVALID as soon as any worker finds a satisfying assignment, and the
+# rest are killed, so a VALID verdict takes about as long as the slowest k.
+# Returns wall clock time.
+def parallel_sat_verify(sel, k_vals, encoding=SEL_ENC_DIRECT, budget=None, store=None,
+                        reduc=WEAK_REDUC):
+    start_time = time.time()
+
+    stored = stored_verdict(store, sel, k_vals, reduc)
+    if stored is not None:
+        return [stored[0], time.time() - start_time]
+
+    tasks = [(k_worker, (sel, k, encoding, budget)) for k in k_vals]
+    winner, results = race_processes(tasks, lambda result: result[1] == True)
+
+    if winner is not None: # Only when not 1/2-good for this subset size
+        if DEBUG_INVALID == True: # Dump details of the invalid selector
+            print(f"k={winner[0]} k_subset: " + str(winner[2]))
+            sel.print_sel(winner[2])
+            input()
+        elapsed = time.time() - start_time
+        record_verdict(store, sel, k_vals, reduc, INVALID, winner[2], elapsed)
+        return [INVALID, elapsed]
+
+    elapsed = time.time() - start_time
+    verdict = UNKNOWN if any(result[1] == UNKNOWN for result in results) else VALID
+    record_verdict(store, sel, k_vals, reduc, verdict, None, elapsed)
+    return [verdict, elapsed]
+
+# The elements of subset selected by the selector, i.e., alone in some set
+def selected_elements(sel, subset):
+    subset = set(subset)
+    selected = set()
+    for sel_set in set_lists(sel):
+        members = [elem for elem in sel_set if elem in subset]
+        if len(members) == 1:
+            selected.add(members[0])
+    return selected
+
+# Exact minimum number of selected elements over all k-subsets, with a subset
+# attaining it, in one solver session. The selector is 1/2-good for k iff the
+# minimum is at least r, so min - r is its margin. z_{v} is only forced up by
+# the clauses, so each model's subset is re-counted exactly and the bound on
+# \sum z_{v} is tightened through assumptions, either linearly (each SAT call
+# drops the bound below the best subset found) or by binary search. "rc2"
+# instead minimizes \sum z_{v} with pysat's RC2 MaxSAT solver. With a budget
+# (linear and binary search only), each solve is limited by it and the
+# minimum is UNKNOWN if one runs out; the subset is then the worst found.
+def min_selected(sel, k, encoding=SEL_ENC_DIRECT, search="linear", budget=None):
+    timer = My_Timer()
+    timer.start_timer()
+    n = sel.n
+
+    if search == "rc2":
+        hard = ClauseSink()
+        top_id = selection_constraints(sel, k, None, hard, None, encoding)
+        xv_k = CardEnc.equals(lits=list(range(n+1, 2*n+1)), bound=k, top_id=top_id,
+                  encoding=CARD_ENCODINGS[DEFAULT_CARD_ENC])
+        wcnf = WCNF()
+        wcnf.extend(hard)
+        wcnf.extend(xv_k.clauses)
+        for zv in range(1, n+1):
+            wcnf.append([NOT * zv], weight=1)
+        with RC2(wcnf) as rc2:
+            worst = model_subset(rc2.compute(), n)
+        timer.stop_timer()
+        return [len(selected_elements(sel, worst)), worst, timer.get_time()]
+
+    model = Cadical153(use_timer = True)
+    top_id = selection_constraints(sel, k, None, model, None, encoding)
+    bounds = CardBounds(n, [k], top_id, z_ubound=k)
+    bounds.add_to(model)
+    x_assumps = bounds.x_assumptions(k)
+
+    # Solve with \sum z_{v} <= bound: True, False or UNKNOWN
+    def solve_at_most(bound):
+        return limited_solve(model, budget, x_assumps + bounds.atmost_lit(bounds.z_upper, bound))
+
+    sat = solve_at_most(k)
+    worst = model_subset(model.get_model(), n) if sat else None
+    best = len(selected_elements(sel, worst)) if sat else None
+    low = 0 # Every subset has at least low selected elements
+    while sat != UNKNOWN and low < best:
+        bound = best - 1 if search == "linear" else (low + best - 1) // 2
+        sat = solve_at_most(bound)
+        if sat == UNKNOWN:
+            print(f"k={k} minimum out of budget ({budget}), at most {best}")
+        elif sat:
+            worst = model_subset(model.get_model(), n)
+            best = len(selected_elements(sel, worst))
+        else:
+            low = bound + 1
+
+    bounds.delete()
+    model.delete()
+    timer.stop_timer()
+    return [best if sat != UNKNOWN else UNKNOWN, worst, timer.get_time()]
+
+# Print the results of that iteration and, if logging data, write it to file.
+# backend optionally names the solver backend(s) that produced the verdict.
+def log_data(sel, data, method, reduc, backend=None):
     output_str = ''
 
     if method == SAT_METHOD:
@@ -422,22 +2263,286 @@ def log_data(sel, data, method, reduc):
     if data[0] == VALID:
         output_str += "   VALID "
         output_str += f"{data[1]:3.4f}"
+    elif data[0] == UNKNOWN:
+        output_str += " UNKNOWN "
+        output_str += f"{data[1]:3.4f}"
     else:
         output_str += " INVALID "
         output_str += f"{data[1]:3.4f}"
 
+    if backend is not None:
+        output_str += f" [{backend}]"
+
     print(output_str, flush=True)
 
     if logging_data:
-        valid_str = 'Y' if data[0] == VALID else 'N'
+        valid_str = 'Y' if data[0] == VALID else ('U' if data[0] == UNKNOWN else 'N')
         method_str = 'sat' if method == SAT_METHOD else 'naive'
         reduc_str = 'weak' if reduc == WEAK_REDUC else 'strong'
         time = data[1]
 
-        data_row = [sel.c, sel.d, sel.n, time, valid_str, method_str, reduc_str, len(sel.family)]
+        data_row = [sel.c, sel.d, sel.n, time, valid_str, method_str, reduc_str, sel.data.num_sets,
+                    sel.k, seed_str(sel.seed) if sel.seed is not None else '']
+        if backend is not None:
+            data_row.append(backend)
         writer.writerow(data_row)
         file_obj.flush()
 
+# Compare the direct and compact selection encodings on the same selectors:
+# clause count, literal count, peak memory of the CNF and incremental solve time
+def benchmark_sel_encodings(n_vals, c, d, num_iters):
+    enc_names = {SEL_ENC_DIRECT: "direct", SEL_ENC_COMPACT: "compact"}
+    for n in n_vals:
+        k = ceil(sqrt(n))
+        k_vals = generate_weak_k_vals(n, k)
+        for iter_ind in range(num_iters):
+            sel = prep_sel(n, k, c, d)
+            for encoding in [SEL_ENC_DIRECT, SEL_ENC_COMPACT]:
+                tracemalloc.start()
+                if encoding == SEL_ENC_COMPACT:
+                    clauses = list(compact_selection_clauses(sel, 2*n))
+                else:
+                    clauses = list(selection_clauses(sel))
+                _, peak_mem = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+                num_clauses = len(clauses)
+                num_lits = sum(len(clause) for clause in clauses)
+                del clauses
+
+                solve_data = incremental_sat_verify(sel, k_vals, encoding)
+                valid_str = "VALID" if solve_data[0] == VALID else "INVALID"
+                print(f"{enc_names[encoding]:>8} n={n:>4} k={k} iter={iter_ind} "
+                      f"clauses={num_clauses} lits={num_lits} "
+                      f"mem={peak_mem / 2**20:.2f}MB solve_time={solve_data[1]:.4f} "
+                      f"{valid_str}", flush=True)
+
+# Check selectors with portfolio_sat_verify, logging each verdict with the
+# backends that won its subset sizes
+def run_portfolio(n_vals, c, d, num_iters):
+    for n in n_vals:
+        k = ceil(sqrt(n))
+        k_vals = generate_weak_k_vals(n, k)
+        for iter_ind in range(num_iters):
+            sel = preprocess_sel(prep_sel(n, k, c, d))
+            verdict, elapsed, winners = portfolio_sat_verify(sel, k_vals, budget=SOLVE_BUDGET)
+            log_data(sel, [verdict, elapsed], SAT_METHOD, WEAK_REDUC, backend="/".join(winners))
+
+# Compare sat_verify and cpsat_verify on the same selectors: solve time and
+# agreement of the verdicts (no cache, falsifier or certificates in front)
+def benchmark_cpsat(n_vals, c, d, num_iters):
+    for n in n_vals:
+        k = ceil(sqrt(n))
+        k_vals = generate_weak_k_vals(n, k)
+        for iter_ind in range(num_iters):
+            sel = preprocess_sel(prep_sel(n, k, c, d))
+            results = {"sat": sat_verify(sel, k_vals, budget=SOLVE_BUDGET),
+                       "cpsat": cpsat_verify(sel, k_vals, budget=SOLVE_BUDGET)}
+            for name, data in results.items():
+                valid_str = "VALID" if data[0] == VALID else ("UNKNOWN" if data[0] == UNKNOWN
+                                                              else "INVALID")
+                print(f"{name:>6} n={n:>4} k={k} iter={iter_ind} "
+                      f"solve_time={data[1]:.4f} {valid_str}", flush=True)
+            if results["sat"][0] != results["cpsat"][0]:
+                print(f"Verdicts differ on n={n} iter={iter_ind}", flush=True)
+
+# Time every cardinality encoding (encode + solve) on the same selectors and
+# record the fastest one per (n, k) band, which card_constraints then uses
+# automatically. Results are saved to CARD_CALIBRATION_FILE.
+def calibrate_card_encodings(n_vals, c, d, num_iters):
+    for n in n_vals:
+        k = ceil(sqrt(n))
+        r = ceil(k/2 - EPS)
+        total_times = {card_enc: 0 for card_enc in CARD_ENCODINGS}
+        for iter_ind in range(num_iters):
+            sel = prep_sel(n, k, c, d)
+            for card_enc in CARD_ENCODINGS:
+                encode_start = time.process_time()
+                model = new_solver(card_enc)
+                formula = []
+                top_id = selection_constraints(sel, k, r, model, None)
+                card_constraints(sel, k, r, model, formula, top_id + 1, card_enc)
+                encode_time = time.process_time() - encode_start
+                model.solve()
+                solve_time = model.time()
+                model.delete()
+                total_times[card_enc] += encode_time + solve_time
+                print(f"{card_enc:>11} n={n:>4} k={k} iter={iter_ind} "
+                      f"card_clauses={len(formula)} encode_time={encode_time:.4f} "
+                      f"solve_time={solve_time:.4f}", flush=True)
+
+        fastest = min(total_times, key=total_times.get)
+        card_enc_table[card_band(n, k)] = fastest
+        print(f"n={n} k={k}: fastest encoding is {fastest}\n", flush=True)
+
+    with open(CARD_CALIBRATION_FILE, 'w') as calib_file:
+        calib_writer = csv.writer(calib_file)
+        calib_writer.writerow(['n_band', 'k_band', 'encoding'])
+        for band in sorted(card_enc_table):
+            calib_writer.writerow([band[0], band[1], card_enc_table[band]])
+
+# Time naive_verify against the bitset and revolving-door engines on the same
+# selectors and check that they all agree on every verdict
+def benchmark_naive_engines(n_vals, c, d, num_iters):
+    engines = {"tuple": naive_verify, "bitset": bitset_naive_verify,
+               "revolving": revolving_naive_verify}
+    for n in n_vals:
+        k = ceil(sqrt(n))
+        k_vals = generate_weak_k_vals(n, k)
+        for iter_ind in range(num_iters):
+            sel = prep_sel(n, k, c, d)
+            verdicts = {}
+            for name, engine in engines.items():
+                with contextlib.redirect_stdout(io.StringIO()):
+                    data = engine(sel, k_vals)
+                verdicts[name] = data[0]
+                valid_str = "VALID" if data[0] == VALID else "INVALID"
+                print(f"{name:>9} n={n:>3} k={k} iter={iter_ind} "
+                      f"solve_time={data[1]:.4f} {valid_str}", flush=True)
+            assert len(set(verdicts.values())) == 1, "Naive engines disagree"
+
+# Retry the instances that ran out of budget, growing the budget by
+# BUDGET_GROWTH each round, for at most MAX_RETRIES rounds
+def retry_unknowns(budget=SOLVE_BUDGET, store=None):
+    for retry in range(MAX_RETRIES):
+        if is_empty(unknown_instances):
+            return
+        budget = budget.grown(BUDGET_GROWTH)
+        pending = unknown_instances[:]
+        unknown_instances.clear()
+        print(f"Retrying {len(pending)} UNKNOWN instance(s) with budget {budget}")
+        for sel, k_vals, reduc in pending:
+            data = incremental_sat_verify(sel, k_vals, budget=budget, store=store, reduc=reduc)
+            log_data(sel, data, SAT_METHOD, reduc)
+            if data[0] == UNKNOWN:
+                unknown_instances.append([sel, k_vals, reduc])
+    if not is_empty(unknown_instances):
+        print(f"{len(unknown_instances)} instance(s) still UNKNOWN after {MAX_RETRIES} retries")
+
+# Sweep over the (c, d) pairs, n values and num_iters selectors per (n, c, d),
+# checking weak and strong reducibility with SAT, and exhaustively when that
+# is small enough (see exhaustive_verify). Iteration i
+# at parameter position p uses the selector of selector_seed(entropy, p, i),
+# and the selectors of each position are generated in one batch. Runs given
+# the same entropy and shard_ind in range(num_shards) split the sweep between
+# them deterministically, each taking every num_shards-th position. The
+# position (n, c, d, iteration, seed) of the selector in progress is
+# checkpointed when it starts, so an interrupted sweep resumes on the same
+# selector, whose exhaustive checks then resume from their own checkpoints.
+def run_sweep(n_vals, cd_vals, num_iters, store=None, entropy=None, shard_ind=0, num_shards=1):
+    checkpoint = Checkpoint("sweep" if num_shards == 1 else f"sweep_{shard_ind}_of_{num_shards}")
+    params = [(n, c, d) for c, d in cd_vals for n in n_vals]
+    positions = [(param_ind, iter_ind) for param_ind in range(shard_ind, len(params), num_shards)
+                 for iter_ind in range(num_iters)]
+    first = 0
+    resume = checkpoint.load()
+    if resume is not None:
+        position = (resume["param_ind"], resume["iter"])
+        if position in positions and params[position[0]] == (resume["n"], resume["c"], resume["d"]):
+            first = positions.index(position)
+            entropy = resume["entropy"]
+            print(f"Resuming sweep at n={resume['n']} c={resume['c']} d={resume['d']} "
+                  f"iter={resume['iter']}")
+    if entropy is None:
+        entropy = np.random.SeedSequence().entropy
+    print(f"Sweep entropy {entropy}, shard {shard_ind} of {num_shards}")
+
+    margin_file = None
+    margin_writer = None
+    if logging_data and SWEEP_MARGINS:
+        margin_file = open(filename + '_margins', 'w')
+        margin_writer = csv.writer(margin_file)
+        margin_writer.writerow(['n', 'k', 'c', 'd', 'seed', 'subset_size', 'r', 'min_selected',
+                                'margin', 'solve_time'])
+
+    batch_ind = None
+    for param_ind, iter_ind in positions[first:]:
+        n, c, d = params[param_ind]
+        k = ceil(sqrt(n))
+        if param_ind != batch_ind:
+            seeds = [selector_seed(entropy, param_ind, i) for i in range(num_iters)]
+            sels = prep_sel_batch(n, k, c, d, seeds)
+            batch_ind = param_ind
+        checkpoint.save({"entropy": entropy, "param_ind": param_ind, "iter": iter_ind,
+                         "n": n, "c": c, "d": d, "seed": seed_str(seeds[iter_ind])})
+
+        print("")
+        if not logging_data:
+            print("[NOT LOGGING DATA]", end='')
+        print(f"====== n={n}, k={k}, c={c}, d={d}, iter={iter_ind} ========\n", flush=True)
+
+        # The set of subset sizes that must be checked for 1/2-goodness in a weakly reducible selector
+        k_vals_weak = generate_weak_k_vals(n, k)
+
+        # The set of subset sizes that must be checked for 1/2-goodness in a strongly reducible selector
+        k_vals_strong = list(range(1, k+1)) # The list [1, 2, ..., k]
+
+        sel = preprocess_sel(sels[iter_ind])
+        sel.data.report()
+
+        sat_weak_data = driver_sat_verify(sel, k_vals_weak, store, WEAK_REDUC)
+        log_data(sel, sat_weak_data, SAT_METHOD, WEAK_REDUC)
+        if sat_weak_data[0] == UNKNOWN:
+            unknown_instances.append([sel, k_vals_weak, WEAK_REDUC])
+
+        sat_strong_data = driver_sat_verify(sel, k_vals_strong, store, STRONG_REDUC)
+        log_data(sel, sat_strong_data, SAT_METHOD, STRONG_REDUC)
+        if sat_strong_data[0] == UNKNOWN:
+            unknown_instances.append([sel, k_vals_strong, STRONG_REDUC])
+        falsifier.run_samples()
+
+        if SWEEP_MARGINS and sat_weak_data[0] != UNKNOWN:
+            log_margins(sel, k_vals_weak, margin_writer)
+            if margin_file is not None:
+                margin_file.flush()
+
+        # No store: the SAT verdicts above are stored under the same key, and
+        # these are the exact cross-check of them
+        for k_vals, reduc in [(k_vals_weak, WEAK_REDUC), (k_vals_strong, STRONG_REDUC)]:
+            naive_data = exhaustive_verify(sel, k_vals, reduc)
+            if naive_data is not None:
+                log_data(sel, naive_data, NAIVE_METHOD, reduc)
+
+    if margin_file is not None:
+        margin_file.close()
+    checkpoint.clear()
+
+# The SAT check of the driver and sweep: every k at once on separate processes
+# with PARALLEL_GOOD_VALS, else the incremental engine behind the witness
+# cache, certificates and falsifier
+def driver_sat_verify(sel, k_vals, store, reduc):
+    if PARALLEL_GOOD_VALS:
+        return parallel_sat_verify(sel, k_vals, budget=SOLVE_BUDGET, store=store, reduc=reduc)
+    return incremental_sat_verify(sel, k_vals, budget=SOLVE_BUDGET, cache=witness_cache,
+                                  store=store, reduc=reduc, falsifier=falsifier,
+                                  certifiers=[cooccurrence_certifier, lp_certifier])
+
+# Quality margin of the selector: for each k of k_vals, the fewest elements
+# selected in any k-subset minus r, printed and written to writer if given.
+# A minimum that runs out of SOLVE_BUDGET is logged as unknown (empty).
+def log_margins(sel, k_vals, writer=None):
+    for k in k_vals:
+        r = ceil(k/2 - EPS)
+        fewest, _, solve_time = min_selected(sel, k, budget=SOLVE_BUDGET)
+        margin = fewest - r if fewest != UNKNOWN else None
+        print(f"\tk={k} min selected {fewest} margin {margin} ({solve_time:.4f}s)")
+        if writer is not None:
+            writer.writerow([sel.n, sel.k, sel.c, sel.d,
+                             seed_str(sel.seed) if sel.seed is not None else '', k, r,
+                             '' if fewest == UNKNOWN else fewest,
+                             '' if margin is None else margin, solve_time])
+
+# The exhaustive cross-check of run_sweep and the driver, sharded over
+# NUM_SHARDS processes when there is more than one core, or None (skipped)
+# when k_vals have more than EXHAUSTIVE_MAX_SUBSETS subsets in total
+def exhaustive_verify(sel, k_vals, reduc):
+    num_subsets = sum(comb(sel.n, k) for k in k_vals)
+    if num_subsets > EXHAUSTIVE_MAX_SUBSETS:
+        print(f"Skipping exhaustive check: {num_subsets} subsets > {EXHAUSTIVE_MAX_SUBSETS}")
+        return None
+    if NUM_SHARDS > 1:
+        return sharded_naive_verify(sel, k_vals, NUM_SHARDS, reduc=reduc)
+    return revolving_naive_verify(sel, k_vals, reduc=reduc)
+
 def is_empty(list_in):
     return len(list_in) == 0
 
@@ -466,36 +2571,84 @@ c,d = 1,2
 
 done = False
 
+if benchmarking_encodings:
+    benchmark_sel_encodings([20, 40, 60, 80], 1, 2, 3)
+    clean_up()
+    sys.exit(0)
+
+if calibrating_card:
+    calibrate_card_encodings([16, 32, 64, 128, 256], 2, 2, 3)
+    clean_up()
+    sys.exit(0)
+
+if benchmarking_naive:
+    benchmark_naive_engines([16, 20, 24, 28], 1, 2, 3)
+    clean_up()
+    sys.exit(0)
+
+if running_portfolio:
+    run_portfolio([20, 40, 60, 80], 2, 2, 3)
+    clean_up()
+    sys.exit(0)
+
+if benchmarking_cpsat:
+    benchmark_cpsat([50, 100, 200, 400], 2, 2, 3)
+    clean_up()
+    sys.exit(0)
+
 print(type(5))
 print(type(5.1))
 
+verdict_store = VerdictStore()
+
+if sweeping:
+    sweep_args = [int(arg) for arg in sys.argv[2:5]] # entropy, shard_ind, num_shards
+    #cd_vals = [[12,12], [12,8], [12,4], [8,8], [8,4], [4,4], [3,2], [2,3], [2,2], [2,1], [1,2], [1,1]]
+    run_sweep(range(100, 1001, 100), [[3, 3]], 1, verdict_store, *sweep_args)
+    done = True
+
+if rematerializing:
+    sel = sel_from_log(sys.argv[2], int(sys.argv[3]))
+    sel.print_sel()
+    for reduc, k_vals in [(WEAK_REDUC, generate_weak_k_vals(sel.n, sel.k)),
+                          (STRONG_REDUC, list(range(1, sel.k+1)))]:
+        log_data(sel, incremental_sat_verify(sel, k_vals, budget=SOLVE_BUDGET, reduc=reduc),
+                 SAT_METHOD, reduc)
+    done = True
 
 while not done:
 
     #k_vals_weak = generate_weak_k_vals(n, k)
     k_vals = [k]
-    sel = prep_sel(n, k, c, d)
+    sel = preprocess_sel(prep_sel(n, k, c, d))
+    sel.data.report()
 
     print("Beginning SAT verification...")
-    sat_weak_data = sat_verify(sel, k_vals)
+    sat_weak_data = driver_sat_verify(sel, k_vals, verdict_store, WEAK_REDUC)
     log_data(sel, sat_weak_data, SAT_METHOD, WEAK_REDUC)
+    falsifier.run_samples()
     is_valid = sat_weak_data[0]
     print(f" =============     SAT solving took time: {sat_weak_data[1]}")
 
-    if not is_valid:
+    if is_valid == UNKNOWN:
+        unknown_instances.append([sel, k_vals, WEAK_REDUC])
+
+    elif not is_valid:
 
-        _,_,subset = naive_verify(sel, k_vals)
+        naive_data = exhaustive_verify(sel, k_vals, WEAK_REDUC)
+        if naive_data is not None:
+            log_data(sel, naive_data, NAIVE_METHOD, WEAK_REDUC)
         #print("Would be naive verifying here, cut that out")
 
         timer = My_Timer()
         timer.start_timer()
 
-        matrix = Matrix()
+        matrix = PackedMatrix()
         matrix.to_matrix(sel)
         matrix.m = k
         matrix.print()
 
-        vp_tree = VPTree(matrix.matrix)
+        vp_tree = VPTree(sel.data.elem_masks)
         vp_tree.print_vptree()
         for i in range(matrix.height):
             closest = vp_tree.k_nn(3, i)
@@ -534,48 +2687,13 @@ while not done:
 
 
 
-"""
-#cd_vals = [[12,12], [12,8], [12,4], [8,8], [8,4], [4,4], [3,2], [2,3], [2,2], [2,1], [1,2], [1,1]]
-n_vals = range(100, 1001, 100)
-
-num_iters = 1
-c, d = 3, 3
-
-for i in range(num_iters):
-    for n in n_vals: # Cycling through n values
-
-        k = ceil(sqrt(n))
-
-        print("")
-        if not logging_data:
-            print("[NOT LOGGING DATA]", end='')
-        print(f"====== n={n}, k={k} ========\n", flush=True)
-
-        # The set of subset sizes that must be checked for 1/2-goodness in a weakly reducible selector
-        k_vals_weak = generate_weak_k_vals(n, k)
-
-        # The set of subset sizes that must be checked for 1/2-goodness in a strongly reducible selector
-        k_vals_strong = range(1, k+1, 1) # The list [1, 2, ..., k]
-
-        print("weak: ", k_vals_weak)
-        print("strong: ", k_vals_strong)
-
-        for iter_ind in range(num_iters): # Generating & testing num_iters different selectors
-
-            sel = prep_sel(n, k, c, d)
-
-            sat_weak_data = sat_verify(sel, k_vals_weak)
-            log_data(sel, sat_weak_data, SAT_METHOD, WEAK_REDUC)
-   
-            sat_strong_data = sat_verify(sel, k_vals_strong)
-            log_data(sel, sat_strong_data, SAT_METHOD, STRONG_REDUC)
-
-            naive_weak_data = naive_verify(sel, k_vals_weak)
-            log_data(sel, naive_weak_data, NAIVE_METHOD, WEAK_REDUC)
-
-            naive_strong_data = naive_verify(sel, k_vals_strong)
-            log_data(sel, naive_strong_data, NAIVE_METHOD, STRONG_REDUC)
-"""
-
+retry_unknowns(store=verdict_store)
+witness_cache.report()
+falsifier.report(filename + '_falsifier' if logging_data else None)
+cooccurrence_certifier.report()
+lp_certifier.report()
+lp_certifier.close()
+verdict_store.report()
+verdict_store.close()
 clean_up()
 print("Successfully terminated")
@@ -0,0 +1,93 @@
+import sys
+import numpy as np
+
+# Compact representation of a selector's family, built once per selector and
+# shared by every engine:
+#   - CSR membership: set i is indices[indptr[i]:indptr[i+1]] (elements in [1,n])
+#   - entry_sets: the set of each CSR entry, i.e., the COO row indices
+#   - inverted index in CSR form: the sets containing element v are
+#     elem_indices[elem_indptr[v]:elem_indptr[v+1]], in increasing order
+#   - bit-packed columns (set_masks[i], bit v-1 for each member v) and rows
+#     (elem_masks[v-1], bit i for each set i containing v) as Python ints.
+#     These are dense (n x num_sets bits in total), so they are only built
+#     when an engine first asks for them.
+class SelectorData:
+    __slots__ = ("n", "num_sets", "indptr", "indices", "entry_sets",
+                 "elem_indptr", "elem_indices", "_set_masks", "_elem_masks")
+
+    def __init__(self, n, indptr, indices):
+        self.n = n
+        self.num_sets = len(indptr) - 1
+        self.indptr = np.asarray(indptr, dtype=np.int64) # No copy if already int64/int32
+        self.indices = np.asarray(indices, dtype=np.int32)
+        self.entry_sets = np.repeat(np.arange(self.num_sets, dtype=np.int32), np.diff(self.indptr))
+
+        order = np.argsort(self.indices, kind='stable') # Stable, so sets stay increasing
+        self.elem_indices = self.entry_sets[order]
+        elem_sizes = np.bincount(self.indices, minlength=n + 1)
+        self.elem_indptr = np.concatenate(([0], np.cumsum(elem_sizes)))
+        self._set_masks = None
+        self._elem_masks = None
+
+    @staticmethod
+    def from_family(n, family):
+        sizes = [len(sel_set) for sel_set in family]
+        indptr = np.concatenate(([0], np.cumsum(sizes, dtype=np.int64)))
+        indices = np.fromiter((v for sel_set in family for v in sel_set), dtype=np.int32,
+                              count=int(indptr[-1]))
+        return SelectorData(n, indptr, indices)
+
+    # Members of set i, as a view into indices
+    def members(self, i):
+        return self.indices[self.indptr[i]:self.indptr[i+1]]
+
+    # Sets containing element v, as a view into elem_indices
+    def sets_of(self, v):
+        return self.elem_indices[self.elem_indptr[v]:self.elem_indptr[v+1]]
+
+    def set_sizes(self):
+        return np.diff(self.indptr)
+
+    @property
+    def set_masks(self):
+        if self._set_masks is None:
+            indices = self.indices.tolist()
+            bounds = self.indptr.tolist()
+            self._set_masks = []
+            for i in range(self.num_sets):
+                mask = 0
+                for v in indices[bounds[i]:bounds[i+1]]:
+                    mask |= 1 << (v - 1)
+                self._set_masks.append(mask)
+        return self._set_masks
+
+    @property
+    def elem_masks(self):
+        if self._elem_masks is None:
+            sets = self.elem_indices.tolist()
+            bounds = self.elem_indptr.tolist()
+            self._elem_masks = []
+            for v in range(1, self.n + 1):
+                mask = 0
+                for i in sets[bounds[v]:bounds[v+1]]:
+                    mask |= 1 << i
+                self._elem_masks.append(mask)
+        return self._elem_masks
+
+    # Bytes used by the arrays and any bit-packed masks built so far
+    def nbytes(self):
+        total = sum(arr.nbytes for arr in [self.indptr, self.indices, self.entry_sets,
+                                           self.elem_indptr, self.elem_indices])
+        for masks in [self._set_masks, self._elem_masks]:
+            if masks is not None:
+                total += sys.getsizeof(masks) + sum(sys.getsizeof(mask) for mask in masks)
+        return total
+
+    # Compare the footprint against the same family as a list of Python lists
+    def report(self):
+        entries = len(self.indices)
+        list_bytes = (sys.getsizeof([None] * self.num_sets)
+                      + sum(sys.getsizeof([None] * int(size)) for size in self.set_sizes())
+                      + entries * sys.getsizeof(2**30)) # Elements above 256 aren't cached
+        print(f"Selector data: n={self.n} sets={self.num_sets} entries={entries} "
+              f"{self.nbytes() / 2**10:.1f}KB (list of lists: {list_bytes / 2**10:.1f}KB)")
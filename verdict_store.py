@@ -0,0 +1,71 @@
+import sqlite3, hashlib, json, time
+
+VERDICT_STORE_FILE = './data/verdicts.sqlite'
+MAX_STORED_VERDICTS = 100000
+
+# Canonical hash of a selector's family: every set sorted, exact duplicates
+# dropped (they don't change any verdict) and the sets themselves sorted
+def selector_hash(sel):
+    indices = sel.data.indices.tolist()
+    bounds = sel.data.indptr.tolist()
+    canon = sorted(set(tuple(sorted(indices[bounds[i]:bounds[i+1]]))
+                       for i in range(sel.data.num_sets)))
+    return hashlib.sha256(f"{sel.n}:{canon}".encode()).hexdigest()
+
+# On-disk store of verification verdicts keyed by (selector hash, subset
+# sizes checked, reducibility mode), so reruns and repeated selectors skip
+# verification. The whole k_vals list is part of the key: a verdict for [k]
+# says nothing about [1, ..., k]. Holds the verdict, the witness k-subset (if
+# invalid) and the solve time. Once more than max_entries are stored, the
+# least recently used are evicted.
+class VerdictStore:
+    def __init__(self, path=VERDICT_STORE_FILE, max_entries=MAX_STORED_VERDICTS):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.conn = sqlite3.connect(path)
+        columns = [row[1] for row in self.conn.execute("PRAGMA table_info(verdicts)")]
+        if 'k' in columns: # Old stores were keyed by the largest k only, which collides
+            self.conn.execute("DROP TABLE verdicts")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS verdicts ("
+                          "sel_hash TEXT, k_vals TEXT, reduc INTEGER, verdict INTEGER, "
+                          "witness TEXT, solve_time REAL, last_used REAL, "
+                          "PRIMARY KEY (sel_hash, k_vals, reduc))")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS lru ON verdicts (last_used)")
+        self.conn.commit()
+
+    # Returns [verdict, witness, solve_time] if stored, else None
+    def lookup(self, sel, k_vals, reduc):
+        key = (selector_hash(sel), json.dumps(list(k_vals)), reduc)
+        row = self.conn.execute("SELECT verdict, witness, solve_time FROM verdicts "
+                                "WHERE sel_hash = ? AND k_vals = ? AND reduc = ?", key).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.conn.execute("UPDATE verdicts SET last_used = ? "
+                          "WHERE sel_hash = ? AND k_vals = ? AND reduc = ?", (time.time(),) + key)
+        self.conn.commit()
+        witness = json.loads(row[1]) if row[1] is not None else None
+        return [bool(row[0]), witness, row[2]]
+
+    def record(self, sel, k_vals, reduc, verdict, witness, solve_time):
+        witness_str = json.dumps(witness) if witness is not None else None
+        self.conn.execute("INSERT OR REPLACE INTO verdicts VALUES (?, ?, ?, ?, ?, ?, ?)",
+                          (selector_hash(sel), json.dumps(list(k_vals)), reduc, int(verdict),
+                           witness_str, solve_time, time.time()))
+        num_entries = self.conn.execute("SELECT COUNT(*) FROM verdicts").fetchone()[0]
+        if num_entries > self.max_entries:
+            self.conn.execute("DELETE FROM verdicts WHERE rowid IN (SELECT rowid FROM "
+                              "verdicts ORDER BY last_used LIMIT ?)",
+                              (num_entries - self.max_entries,))
+        self.conn.commit()
+
+    def report(self):
+        lookups = self.hits + self.misses
+        if lookups == 0:
+            return
+        print(f"Verdict store: {self.hits}/{lookups} hits ({100 * self.hits / lookups:.1f}%)")
+
+    def close(self):
+        self.conn.close()
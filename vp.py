@@ -180,7 +180,11 @@ class VPTree:
                 dists.append(dist)
         return median(dists)
 
+    # Vectors are either 0/1 lists or bit-packed ints, e.g., the rows
+    # elem_masks of a selector's SelectorData, compared with a popcount
     def hamming(v1, v2):
+        if type(v1) == int:
+            return (v1 ^ v2).bit_count()
         assert len(v1) == len(v2)
         dist = 0
         for i in range(len(v1)):